@@ -0,0 +1,176 @@
+"""Benchmark for inverted index
+
+Generates synthetic corpus with Zipfian distribution of words and measures
+load_documents, build_inverted_index, dump and load of every storage policy
+and query throughput. Results are printed in json to compare versions.
+Load and queries of every storage policy run in a new process, so peak RSS
+of these stages is comparable between policies.
+
+Example:
+    python benchmark_inverted_index.py --documents 10000 --output bench.json
+"""
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import Callable, Dict, List
+
+from inverted_index import (
+    InvertedIndex,
+    STORAGE_POLICIES,
+    build_inverted_index,
+    load_documents,
+)
+from stage_stats import peak_rss_kb
+
+
+DEFAULT_NUM_DOCUMENTS = 10000
+DEFAULT_WORDS_PER_DOCUMENT = 100
+DEFAULT_VOCABULARY_SIZE = 50000
+DEFAULT_ZIPF_EXPONENT = 1.1
+DEFAULT_NUM_QUERIES = 1000
+DEFAULT_SEED = 42
+
+
+class ZipfWordSampler:
+    """Sample words "w<rank>" with probability proportional to 1 / rank ** exponent"""
+    def __init__(self, vocabulary_size: int, exponent: float, seed: int):
+        self.words = [f"w{rank}" for rank in range(1, vocabulary_size + 1)]
+        self.cum_weights = list(accumulate(1 / rank ** exponent for rank in range(1, vocabulary_size + 1)))
+        self.random = random.Random(seed)
+
+    def sample(self, num_words: int) -> List[str]:
+        return self.random.choices(self.words, cum_weights=self.cum_weights, k=num_words)
+
+
+def generate_corpus(
+        filepath: str, num_documents: int = DEFAULT_NUM_DOCUMENTS,
+        words_per_document: int = DEFAULT_WORDS_PER_DOCUMENT,
+        vocabulary_size: int = DEFAULT_VOCABULARY_SIZE,
+        zipf_exponent: float = DEFAULT_ZIPF_EXPONENT, seed: int = DEFAULT_SEED,
+):
+    """Write dataset of num_documents documents in format "<doc_id>\\t<words>" """
+    sampler = ZipfWordSampler(vocabulary_size, zipf_exponent, seed)
+    with open(filepath, "w", encoding="utf_8") as file:
+        for doc_id in range(1, num_documents + 1):
+            file.write(f"{doc_id}\t{' '.join(sampler.sample(words_per_document))}\n")
+
+
+def measure(stage: Callable):
+    """Run stage and return its result with wall time and peak RSS
+
+    Peak RSS is a high-water mark of the whole process, not of the stage.
+    """
+    start = perf_counter()
+    result = stage()
+    stats = {"seconds": perf_counter() - start, "peak_rss_kb": peak_rss_kb()}
+    return result, stats
+
+
+def _load_and_query(index_filepath: str, storage_policy: str, queries: List[List[str]]) -> Dict:
+    """Load inverted index and run queries, it is called in a new process"""
+    start_rss_kb = peak_rss_kb()
+    loaded_index, load_stats = measure(lambda: InvertedIndex.load(index_filepath, storage_policy))
+    load_stats["start_rss_kb"] = start_rss_kb
+    _, query_stats = measure(lambda: [loaded_index.query(query) for query in queries])
+    query_stats["queries_per_second"] = len(queries) / query_stats["seconds"]
+    return {"load": load_stats, "query": query_stats}
+
+
+def measure_load_and_query(index_filepath: str, storage_policy: str, queries: List[List[str]]) -> Dict:
+    """Measure load and queries in a new spawned process, which does not share memory of this one"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(_load_and_query, index_filepath, storage_policy, queries).result()
+
+
+def run_benchmark(
+        num_documents: int = DEFAULT_NUM_DOCUMENTS,
+        words_per_document: int = DEFAULT_WORDS_PER_DOCUMENT,
+        vocabulary_size: int = DEFAULT_VOCABULARY_SIZE,
+        zipf_exponent: float = DEFAULT_ZIPF_EXPONENT,
+        num_queries: int = DEFAULT_NUM_QUERIES,
+        seed: int = DEFAULT_SEED,
+) -> Dict:
+    """Run all stages of benchmark and return report"""
+    report = {
+        "python": platform.python_version(),
+        "params": {
+            "num_documents": num_documents,
+            "words_per_document": words_per_document,
+            "vocabulary_size": vocabulary_size,
+            "zipf_exponent": zipf_exponent,
+            "num_queries": num_queries,
+            "seed": seed,
+        },
+        "stages": {},
+    }
+    stages = report["stages"]
+    with TemporaryDirectory() as work_dir:
+        dataset_filepath = os.path.join(work_dir, "dataset.txt")
+        generate_corpus(dataset_filepath, num_documents, words_per_document, vocabulary_size, zipf_exponent, seed)
+
+        documents, stages["load_documents"] = measure(lambda: load_documents(dataset_filepath))
+        inverted_index, stages["build_inverted_index"] = measure(lambda: build_inverted_index(documents))
+        stages["build_inverted_index"]["num_terms"] = len(inverted_index.inv_idx_dict)
+        del documents
+
+        sampler = ZipfWordSampler(vocabulary_size, zipf_exponent, seed + 1)
+        queries = [sampler.sample(sampler.random.randint(1, 3)) for _ in range(num_queries)]
+
+        for storage_policy in STORAGE_POLICIES:
+            index_filepath = os.path.join(work_dir, storage_policy)
+            try:
+                _, dump_stats = measure(lambda: inverted_index.dump(index_filepath, storage_policy))
+                load_and_query_stats = measure_load_and_query(index_filepath, storage_policy, queries)
+            except Exception as error:
+                stages[storage_policy] = {"error": repr(error)}
+                continue
+
+            stages[storage_policy] = {
+                "file_size": os.path.getsize(index_filepath),
+                "dump": dump_stats,
+                **load_and_query_stats,
+            }
+
+    return report
+
+
+def main():
+    parser = ArgumentParser(
+        prog="benchmark-inverted-index",
+        description="benchmark of inverted index on synthetic corpus",
+    )
+    parser.add_argument("--documents", type=int, default=DEFAULT_NUM_DOCUMENTS, dest="num_documents")
+    parser.add_argument("--words-per-document", type=int, default=DEFAULT_WORDS_PER_DOCUMENT)
+    parser.add_argument("--vocabulary-size", type=int, default=DEFAULT_VOCABULARY_SIZE)
+    parser.add_argument("--zipf-exponent", type=float, default=DEFAULT_ZIPF_EXPONENT)
+    parser.add_argument("--queries", type=int, default=DEFAULT_NUM_QUERIES, dest="num_queries")
+    parser.add_argument("--seed", type=int, default=DEFAULT_SEED)
+    parser.add_argument("--output", default=None, help="path to json report, stdout by default")
+    arguments = parser.parse_args()
+
+    report = run_benchmark(
+        num_documents=arguments.num_documents,
+        words_per_document=arguments.words_per_document,
+        vocabulary_size=arguments.vocabulary_size,
+        zipf_exponent=arguments.zipf_exponent,
+        num_queries=arguments.num_queries,
+        seed=arguments.seed,
+    )
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print(file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""Boolean queries with AND, OR, NOT and parentheses
+
+Query is parsed into a tree and evaluated by a tree of lazy posting
+iterators: every iterator stands on a document id and moves forward only
+by next() or advance(target), so intermediate results are never built
+and the first documents are found without scanning whole posting lists.
+
+Grammar (operators are upper case, neighbour terms are joined by AND):
+    or_expr  := and_expr ("OR" and_expr)*
+    and_expr := not_expr ("AND"? not_expr)*
+    not_expr := "NOT" not_expr | "(" or_expr ")" | word
+NOT is allowed only as a part of AND group with a positive term: "a AND NOT b".
+"""
+from re import findall
+from typing import Callable, Iterator, List, Sequence
+
+from posting_list import gallop
+
+
+NO_MORE_DOCS = 1 << 64
+NO_DOC_YET = -(1 << 64)
+OPERATORS = ("AND", "OR", "NOT", "(", ")")
+
+
+class QuerySyntaxError(ValueError):
+    """Boolean query can not be parsed"""
+
+
+def tokenize_query(query: str) -> List[str]:
+    return findall(r"\(|\)|[^\s()]+", query)
+
+
+def parse_query(query: str):
+    """Parse boolean query into tree of tuples
+
+    Nodes: ("word", word), ("and", [nodes]), ("or", [nodes]), ("not", node).
+    """
+    tokens = tokenize_query(query)
+    position = 0
+
+    def peek():
+        return tokens[position] if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        children = [parse_and()]
+        while peek() == "OR":
+            take()
+            children.append(parse_and())
+        return children[0] if len(children) == 1 else ("or", children)
+
+    def parse_and():
+        children = [parse_not()]
+        while peek() is not None and peek() not in ("OR", ")"):
+            if peek() == "AND":
+                take()
+            children.append(parse_not())
+        return children[0] if len(children) == 1 else ("and", children)
+
+    def parse_not():
+        token = peek()
+        if token is None:
+            raise QuerySyntaxError(f"unexpected end of query {query!r}")
+        if token == "NOT":
+            take()
+            return ("not", parse_not())
+        if token == "(":
+            take()
+            node = parse_or()
+            if peek() != ")":
+                raise QuerySyntaxError(f"missing ) in query {query!r}")
+            take()
+            return node
+        if token in OPERATORS:
+            raise QuerySyntaxError(f"unexpected {token} in query {query!r}")
+        return ("word", take())
+
+    node = parse_or()
+    if peek() is not None:
+        raise QuerySyntaxError(f"unexpected {peek()} in query {query!r}")
+
+    return node
+
+
+class PostingsIterator:
+    """Iterator over sorted posting list, advance gallops from the current position"""
+    def __init__(self, postings: Sequence[int]):
+        self.postings = postings
+        self.position = -1
+        self.doc = NO_DOC_YET
+
+    def cost(self) -> int:
+        return len(self.postings)
+
+    def _move(self, position: int) -> int:
+        self.position = position
+        self.doc = int(self.postings[position]) if position < len(self.postings) else NO_MORE_DOCS
+        return self.doc
+
+    def next(self) -> int:
+        return self._move(self.position + 1)
+
+    def advance(self, target: int) -> int:
+        if self.doc >= target:
+            return self.doc
+        if target >= NO_MORE_DOCS:
+            return self._move(len(self.postings))
+        return self._move(gallop(self.postings, target, max(self.position, 0)))
+
+
+class AndIterator:
+    """Documents of all children: the cheapest child leads, others advance to it"""
+    def __init__(self, children: List):
+        self.children = sorted(children, key=lambda child: child.cost())
+        self.doc = NO_DOC_YET
+
+    def cost(self) -> int:
+        return self.children[0].cost()
+
+    def _align(self, target: int) -> int:
+        lead = self.children[0]
+        while target != NO_MORE_DOCS:
+            for child in self.children[1:]:
+                doc = child.advance(target)
+                if doc > target:
+                    target = lead.advance(doc)
+                    break
+            else:
+                break
+        self.doc = target
+        return target
+
+    def next(self) -> int:
+        return self._align(self.children[0].next())
+
+    def advance(self, target: int) -> int:
+        if self.doc >= target:
+            return self.doc
+        return self._align(self.children[0].advance(target))
+
+
+class OrIterator:
+    """Documents of any child"""
+    def __init__(self, children: List):
+        self.children = children
+        self.doc = NO_DOC_YET
+
+    def cost(self) -> int:
+        return sum(child.cost() for child in self.children)
+
+    def next(self) -> int:
+        return self.advance(self.doc + 1)
+
+    def advance(self, target: int) -> int:
+        if self.doc >= target:
+            return self.doc
+        self.doc = min(child.advance(target) for child in self.children)
+        return self.doc
+
+
+class AndNotIterator:
+    """Documents of include iterator which are not in exclude iterator"""
+    def __init__(self, include, exclude):
+        self.include = include
+        self.exclude = exclude
+        self.doc = NO_DOC_YET
+
+    def cost(self) -> int:
+        return self.include.cost()
+
+    def _skip_excluded(self, doc: int) -> int:
+        while doc != NO_MORE_DOCS and self.exclude.advance(doc) == doc:
+            doc = self.include.next()
+        self.doc = doc
+        return doc
+
+    def next(self) -> int:
+        return self._skip_excluded(self.include.next())
+
+    def advance(self, target: int) -> int:
+        if self.doc >= target:
+            return self.doc
+        return self._skip_excluded(self.include.advance(target))
+
+
+def build_iterator(node, make_word_iterator: Callable):
+    """Build tree of iterators for parsed query, make_word_iterator(word) returns iterator of word"""
+    kind, value = node
+    if kind == "word":
+        return make_word_iterator(value)
+    if kind == "or":
+        return OrIterator([build_iterator(child, make_word_iterator) for child in value])
+    if kind == "not":
+        raise QuerySyntaxError("NOT needs a positive term in the same AND group")
+
+    include = [build_iterator(child, make_word_iterator) for child in value if child[0] != "not"]
+    exclude = [build_iterator(child[1], make_word_iterator) for child in value if child[0] == "not"]
+    if not include:
+        raise QuerySyntaxError("NOT needs a positive term in the same AND group")
+
+    iterator = include[0] if len(include) == 1 else AndIterator(include)
+    if exclude:
+        iterator = AndNotIterator(iterator, exclude[0] if len(exclude) == 1 else OrIterator(exclude))
+
+    return iterator
+
+
+def iterate_documents(iterator, limit: int = None) -> Iterator[int]:
+    """Yield document ids of iterator, at most limit of them"""
+    count = 0
+    while limit is None or count < limit:
+        doc = iterator.next()
+        if doc == NO_MORE_DOCS:
+            return
+        yield doc
+        count += 1
@@ -0,0 +1,84 @@
+"""Streaming reader of text datasets
+
+Dataset is read through a buffer of READ_BUFFER_SIZE bytes and lines are
+decoded by io.TextIOWrapper, which is as fast as open() in text mode. Input
+compressed by gzip or zstandard is detected by magic bytes and decompressed
+on the fly (zstandard requires package zstandard), "-" stands for stdin.
+"""
+from contextlib import contextmanager
+import gzip
+import io
+import sys
+from typing import Iterator, Tuple
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, only .zst input needs it
+    zstandard = None
+
+
+READ_BUFFER_SIZE = 1 << 20
+STDIN_PATH = "-"
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def _detect_compression(file) -> str:
+    magic = file.peek(len(ZSTD_MAGIC))[:len(ZSTD_MAGIC)]
+    if magic.startswith(GZIP_MAGIC):
+        return "gzip"
+    if magic.startswith(ZSTD_MAGIC):
+        return "zstd"
+    return None
+
+
+def is_seekable_dataset(filepath: str) -> bool:
+    """Check that dataset is an uncompressed file, so it can be split by byte offsets"""
+    if filepath == STDIN_PATH:
+        return False
+
+    with open(filepath, "rb") as file:
+        return _detect_compression(file) is None
+
+
+@contextmanager
+def open_dataset(filepath: str):
+    """Open dataset file or stdin for binary reading, compressed input is decompressed"""
+    if filepath == STDIN_PATH:
+        file = sys.stdin.buffer
+    else:
+        file = open(filepath, "rb", buffering=READ_BUFFER_SIZE)
+
+    try:
+        compression = _detect_compression(file)
+        if compression == "gzip":
+            yield gzip.GzipFile(fileobj=file)
+        elif compression == "zstd":
+            if zstandard is None:
+                raise ImportError(f"package zstandard is required to read {filepath}")
+            yield zstandard.ZstdDecompressor().stream_reader(file)
+        else:
+            yield file
+    finally:
+        if file is not sys.stdin.buffer:
+            file.close()
+
+
+def iter_lines(filepath: str, encoding: str = "utf_8") -> Iterator[str]:
+    """Lazily read lines of dataset without line breaks"""
+    with open_dataset(filepath) as file:
+        text_file = io.TextIOWrapper(file, encoding=encoding)
+        try:
+            for line in text_file:
+                yield line.rstrip("\n")
+        finally:
+            text_file.detach()
+
+
+def iter_records(filepath: str, encoding: str = "utf_8") -> Iterator[Tuple[str, str]]:
+    """Lazily read (document id, text) records of dataset, empty lines are skipped"""
+    for line in iter_lines(filepath, encoding):
+        if not line.strip():
+            continue
+        document_id, *text = line.split(None, 1)
+        yield document_id, (text[0] if text else "")
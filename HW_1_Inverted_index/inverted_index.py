@@ -5,11 +5,62 @@ Please, for work with inverted index use class "InvertedIndex" and function "bui
 For load documents use function "load_documents"
 """
 from argparse import ArgumentParser, FileType
-from collections import defaultdict
+from array import array
+from collections import OrderedDict, defaultdict
+import cProfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import lru_cache
+from heapq import merge, nsmallest
+from itertools import filterfalse, islice
+import json
+import os
 import sys
-from typing import List, Dict
+from tempfile import TemporaryDirectory
+from threading import Lock
+from typing import Dict, Iterator, List, Tuple
 
-from storage_policy import ArrayStoragePolicy, JsonStoragePolicy
+from boolean_query import (
+    AndIterator,
+    PostingsIterator,
+    build_iterator,
+    iterate_documents,
+    parse_query,
+)
+from document_reader import is_seekable_dataset, iter_lines
+from inverted_index_server import (
+    DEFAULT_HOST,
+    DEFAULT_PORT,
+    InvertedIndexClient,
+    make_server,
+    measure_latency,
+)
+from positional_index import PositionalPostings, match_phrase
+from posting_list import intersect_sorted, make_posting_list, union_postings
+from posting_runs import merge_runs, write_run
+from ranking import Bm25Statistics, top_k_wand
+from stage_stats import StageStats
+from storage_policy import (
+    STORAGE_POLICIES,
+    detect_storage_policy,
+    get_storage_policy,
+    verify_index_file,
+)
+from term_dictionary import FrontCodedTermDictionary
+from tokenizer import STEMMERS, WILDCARD, Tokenizer, Vocabulary
+
+
+DEFAULT_QUERY_CACHE_SIZE = 1024
+DEFAULT_POSTINGS_CACHE_SIZE = 4096
+QUERY_OUTPUT_CHUNK_SIZE = 4096
+BM25_STATISTICS_SUFFIX = ".bm25"
+POSITIONS_SUFFIX = ".positions"
+TOKENIZER_SUFFIX = ".tokenizer.json"
+SIDECAR_SUFFIXES = (BM25_STATISTICS_SUFFIX, POSITIONS_SUFFIX, TOKENIZER_SUFFIX)
+DEFAULT_TOP_K = 10
+SEGMENTS_MANIFEST_SUFFIX = ".segments.json"
+SHARDS_MANIFEST_SUFFIX = ".shards.json"
+TERM_MEMORY_ESTIMATE = 120
+POSTING_MEMORY_ESTIMATE = 40
 
 
 class InvertedIndex:
@@ -17,16 +68,38 @@ class InvertedIndex:
 
     main methods:
     - query(words: List[str]) -> List[str]:
-        return the list of relevant documents for the given query
+        return the list of relevant documents for the given query,
+        word "prefix*" matches any word which starts with prefix
+
+    - query_ranked(words: List[str], top_k: int) -> List[Tuple[str, float]]:
+        return top_k documents by BM25, index should be built with frequencies
+
+    - query_phrase(words: List[str], slop: int) -> List[str]:
+        return documents with the phrase, index should be built with positions
+
+    - query_boolean(query: str, limit: int) -> List[str]:
+        return documents matching query with AND, OR, NOT and parentheses
+
+    - explain(words: List[str]) -> Dict:
+        return plan of query with estimated and actual sizes of intermediate results
 
     - dump(filepath: str, storage_policy="array_storage_policy"):
         dump inverted index into hard drive
 
-    - load(filepath: str, storage_policy="array_storage_policy"):
-        load inverted index from hard drive (classmethod)
+    - load(filepath: str, storage_policy=None):
+        load inverted index from hard drive (classmethod),
+        storage policy is detected by header of file by default
     """
-    def __init__(self):
+    def __init__(self, postings_cache_size: int = DEFAULT_POSTINGS_CACHE_SIZE):
         self.inv_idx_dict = None
+        self.bm25_statistics = None
+        self.positional_postings = None
+        self.tokenizer = Tokenizer()
+        self.storage_policy = None
+        self.postings_cache_size = postings_cache_size
+        self._postings_cache = OrderedDict()
+        self._postings_cache_lock = Lock()
+        self._term_dictionary = None
 
     def __eq__(self, other):
         return self.inv_idx_dict == other.inv_idx_dict
@@ -34,17 +107,246 @@ class InvertedIndex:
     def set_inverted_index_dict(self, inv_idx_dict: Dict[str, List[str]]):
         """Set new inverted index"""
         self.inv_idx_dict = inv_idx_dict
+        self._postings_cache = OrderedDict()
+        self._term_dictionary = None
+
+    def _get_postings(self, word: str):
+        """Return sorted array of integer document ids for indexed word or None
+
+        Word is looked up as is, a trailing "*" is a part of word here.
+        Converted posting lists of the last postings_cache_size used words
+        are kept in LRU cache for the next queries. Cache is shared by threads
+        of the server, so it is changed under lock, posting lists are decoded without it.
+        """
+        with self._postings_cache_lock:
+            if word in self._postings_cache:
+                self._postings_cache.move_to_end(word)
+                return self._postings_cache[word]
+
+        if hasattr(self.inv_idx_dict, "get_int_postings"):
+            postings = self.inv_idx_dict.get_int_postings(word)
+        else:
+            doc_ids = self.inv_idx_dict.get(word)
+            postings = None if doc_ids is None else make_posting_list(doc_ids)
+
+        with self._postings_cache_lock:
+            self._postings_cache[word] = postings
+            self._postings_cache.move_to_end(word)
+            if len(self._postings_cache) > self.postings_cache_size:
+                self._postings_cache.popitem(last=False)
+        return postings
+
+    def _get_query_postings(self, word: str):
+        """Return posting list of query word or None, "prefix*" is union over words with prefix"""
+        if word.endswith(WILDCARD):
+            return self._get_prefix_postings(word[:-len(WILDCARD)])
+        return self._get_postings(word)
+
+    def _get_prefix_postings(self, prefix: str):
+        """Return union of posting lists of words with prefix or None"""
+        postings_lists = [self._get_postings(word) for word in self.terms_with_prefix(prefix)]
+        if not postings_lists:
+            return None
+
+        return union_postings(postings_lists)
+
+    def _get_term_dictionary(self):
+        """Return sorted dictionary of words, the mapping itself if it is sorted"""
+        if hasattr(self.inv_idx_dict, "keys_with_prefix"):
+            return self.inv_idx_dict
+
+        if self._term_dictionary is None:
+            self._term_dictionary = FrontCodedTermDictionary.from_words(self.inv_idx_dict)
+        return self._term_dictionary
+
+    def terms_with_prefix(self, prefix: str) -> List[str]:
+        """Return sorted words of index which start with prefix"""
+        term_dictionary = self._get_term_dictionary()
+        if term_dictionary is self.inv_idx_dict:
+            return list(term_dictionary.keys_with_prefix(prefix))
+
+        return [word for _, word in term_dictionary.prefix(prefix)]
+
+    def terms_in_range(self, low: str, high: str) -> List[str]:
+        """Return sorted words of index in range [low, high)"""
+        term_dictionary = self._get_term_dictionary()
+        if term_dictionary is self.inv_idx_dict:
+            return list(term_dictionary.keys_in_range(low, high))
+
+        return [word for _, word in term_dictionary.range(low, high)]
+
+    def document_frequency(self, word: str) -> int:
+        """Return number of documents with query word without decoding its posting list
+
+        For "prefix*" the sum over matching words is returned, it is an upper bound.
+        """
+        if word.endswith(WILDCARD):
+            return sum(map(self._exact_document_frequency, self.terms_with_prefix(word[:-len(WILDCARD)])))
+        return self._exact_document_frequency(word)
+
+    def _exact_document_frequency(self, word: str) -> int:
+        """Return number of documents with indexed word, a trailing "*" is a part of word here"""
+        with self._postings_cache_lock:
+            if word in self._postings_cache:
+                postings = self._postings_cache[word]
+                return len(postings) if postings is not None else 0
+
+        if hasattr(self.inv_idx_dict, "document_frequency"):
+            return self.inv_idx_dict.document_frequency(word)
+        return len(self.inv_idx_dict.get(word, ()))
+
+    def plan_query(self, words: List[str]) -> List[Tuple[str, int]]:
+        """Return distinct normalized words with document frequencies in order of intersection"""
+        words = set(self.tokenizer.normalize_query(words))
+        return sorted(
+            ((word, self.document_frequency(word)) for word in words),
+            key=lambda step: (step[1], step[0]),
+        )
 
     def query(self, words: List[str]) -> List[str]:
-        """Return the list of relevant documents for the given query"""
+        """Return the list of relevant documents for the given query
+
+        Posting lists are intersected as integer arrays in order of document
+        frequencies, documents are converted to string ids only for the result.
+        """
+        return list(map(str, self._query_postings(words).tolist()))
+
+    def _query_postings(self, words: List[str]):
+        """Return sorted integer document ids which contain all words
+
+        A missing word is found by the plan before any posting list is decoded,
+        intersection stops as soon as the intermediate result is empty.
+        """
+        plan = self.plan_query(words)
+        if not plan or plan[0][1] == 0:
+            return array("q")
+
+        result = self._get_query_postings(plan[0][0])
+        for word, _ in plan[1:]:
+            if not len(result):
+                break
+            result = intersect_sorted(result, self._get_query_postings(word))
+
+        return result
+
+    def query_boolean(self, query: str, limit: int = None) -> List[str]:
+        """Return documents matching boolean query, at most limit of them
+
+        Example: "python AND (snake OR code) AND NOT java", neighbour words are
+        joined by AND. Query is evaluated by lazy posting iterators, so only
+        the first limit documents are looked for.
+        """
+        iterator = build_iterator(parse_query(query), self._make_word_iterator)
+        return [str(doc_id) for doc_id in iterate_documents(iterator, limit)]
+
+    def _make_word_iterator(self, word: str):
+        """Return posting iterator of word, a word normalized into several words is their AND"""
+        iterators = []
+        for normalized_word in self.tokenizer.normalize_query([word]) or [word]:
+            postings = self._get_query_postings(normalized_word)
+            iterators.append(PostingsIterator(postings if postings is not None else array("q")))
+
+        return iterators[0] if len(iterators) == 1 else AndIterator(iterators)
+
+    def explain(self, words: List[str]) -> Dict:
+        """Run query and return its plan with estimated and actual sizes of intermediate results
+
+        Estimation assumes independent words if number of documents is known
+        (index with frequencies), otherwise it is the upper bound: the minimal
+        document frequency. Steps after an empty result are skipped.
+        """
+        num_documents = self.bm25_statistics.num_documents if self.bm25_statistics is not None else None
+        steps = []
+        estimated = None
+        result = None
+        for word, document_frequency in self.plan_query(words):
+            if estimated is None:
+                estimated = document_frequency
+            elif num_documents:
+                estimated = estimated * document_frequency / num_documents
+            else:
+                estimated = min(estimated, document_frequency)
+
+            skipped = result is not None and not len(result)
+            if not skipped:
+                postings = self._get_query_postings(word)
+                if postings is None:
+                    postings = array("q")
+                result = postings if result is None else intersect_sorted(result, postings)
+            steps.append({
+                "word": word,
+                "document_frequency": document_frequency,
+                "estimated": estimated,
+                "actual": len(result),
+                "skipped": skipped,
+            })
+
+        return {
+            "num_documents": num_documents,
+            "steps": steps,
+            "estimated": estimated or 0,
+            "actual": len(result) if result is not None else 0,
+        }
+
+    def query_phrase(self, words: List[str], slop: int = 0) -> List[str]:
+        """Return documents where words occur in order with at most slop words between neighbours
+
+        Candidates are found by intersection of posting lists first,
+        positions are decoded only for them.
+        """
+        if self.positional_postings is None:
+            raise ValueError("inverted index is built without positions")
+        words = self.tokenizer.normalize_query(words)
+        if any(word.endswith(WILDCARD) for word in words):
+            raise ValueError(f"wildcard words are not supported in phrase queries: {words}")
         if not words:
             return []
 
-        result = set(self.inv_idx_dict.get(words[0], []))
+        document_ids = []
+        for doc_id in self._query_postings(words):
+            positions_lists = [
+                self.positional_postings.get_positions(word, doc_id) for word in words
+            ]
+            if match_phrase(positions_lists, slop):
+                document_ids.append(str(doc_id))
+
+        return document_ids
+
+    def query_ranked(self, words: List[str], top_k: int = DEFAULT_TOP_K) -> List[Tuple[str, float]]:
+        """Return top_k documents containing any of words ranked by BM25
+
+        Word "prefix*" is scored as all words of index with prefix.
+        WAND skips documents which can not get into top_k by upper bounds of term scores.
+        """
+        if self.bm25_statistics is None:
+            raise ValueError("inverted index is built without term frequencies")
+
+        terms = []
+        for word in self._expand_wildcards(self.tokenizer.normalize_query(words)):
+            postings = self._get_postings(word)
+            if postings is None or not len(postings):
+                continue
+            idf = self.bm25_statistics.idf(len(postings))
+            terms.append((
+                postings, self.bm25_statistics.term_frequencies[word], idf,
+                self.bm25_statistics.upper_bound(word, idf),
+            ))
+
+        return [
+            (str(doc_id), score)
+            for doc_id, score in top_k_wand(terms, self.bm25_statistics, top_k)
+        ]
+
+    def _expand_wildcards(self, words: List[str]) -> List[str]:
+        """Return distinct words where every "prefix*" is replaced by words of index with prefix"""
+        expanded_words = set()
         for word in words:
-            result.intersection_update(self.inv_idx_dict.get(word, set()))
+            if word.endswith(WILDCARD):
+                expanded_words.update(self.terms_with_prefix(word[:-len(WILDCARD)]))
+            else:
+                expanded_words.add(word)
 
-        return list(result)
+        return sorted(expanded_words)
 
     def dump(self, filepath: str, storage_policy="array_storage_policy"):
         """Dump inverted index into hard drive
@@ -52,87 +354,796 @@ class InvertedIndex:
         You can choose a policy to dump:
         - array_storage_policy : saving to a binary file using compression using the library struct.
         - json_storage_policy : saving to a file in format json
+        - compressed_storage_policy : saving to a binary file with delta and varint encoded posting lists
+        - mmap_storage_policy : saving to a binary file with sorted term table for lazy loading
         """
         print("start dump inverted index...", file=sys.stderr)
-        if storage_policy == "array_storage_policy":
-            ArrayStoragePolicy().dump(self.inv_idx_dict, filepath)
+        get_storage_policy(storage_policy).dump(self.inv_idx_dict, filepath)
 
-        if storage_policy == "json_storage_policy":
-            JsonStoragePolicy().dump(self.inv_idx_dict, filepath)
+        if self.bm25_statistics is not None:
+            self.bm25_statistics.dump(f"{filepath}{BM25_STATISTICS_SUFFIX}")
+
+        if self.positional_postings is not None:
+            self.positional_postings.dump(f"{filepath}{POSITIONS_SUFFIX}")
+
+        if not self.tokenizer.is_default:
+            self.tokenizer.dump(f"{filepath}{TOKENIZER_SUFFIX}")
 
     @classmethod
-    def load(cls, filepath: str, storage_policy="array_storage_policy"):
+    def load(cls, filepath: str, storage_policy=None):
         """Load inverted index from hard drive
 
+        Policy is detected by header of file if it is not given.
         You can choose a policy to load:
         - array_storage_policy : saving to a binary file using compression using the library struct.
         - json_storage_policy : saving to a file in format json
+        - compressed_storage_policy : saving to a binary file with delta and varint encoded posting lists
+        - mmap_storage_policy : memory-map the file, posting lists are decoded on demand
         """
         print("start load inverted index...", file=sys.stderr)
         inv_index = InvertedIndex()
+        inv_index.storage_policy = storage_policy or detect_storage_policy(filepath)
+        inv_index.set_inverted_index_dict(get_storage_policy(inv_index.storage_policy).load(filepath))
 
-        if storage_policy == "array_storage_policy":
-            inv_index.set_inverted_index_dict(ArrayStoragePolicy().load(filepath))
+        if os.path.exists(f"{filepath}{BM25_STATISTICS_SUFFIX}"):
+            inv_index.bm25_statistics = Bm25Statistics.load(f"{filepath}{BM25_STATISTICS_SUFFIX}")
 
-        if storage_policy == "json_storage_policy":
-            inv_index.set_inverted_index_dict(JsonStoragePolicy().load(filepath))
+        if os.path.exists(f"{filepath}{POSITIONS_SUFFIX}"):
+            inv_index.positional_postings = PositionalPostings.load(f"{filepath}{POSITIONS_SUFFIX}")
+
+        if os.path.exists(f"{filepath}{TOKENIZER_SUFFIX}"):
+            inv_index.tokenizer = Tokenizer.load(f"{filepath}{TOKENIZER_SUFFIX}")
 
         return inv_index
 
 
+def iter_documents(filepath: str) -> Iterator[str]:
+    """Lazily read documents from hard drive one by one
+
+    Dataset is read by large blocks, it can be compressed by gzip or zstandard, "-" reads stdin.
+    """
+    return iter_lines(filepath, encoding="utf_8")
+
+
 def load_documents(filepath: str) -> List[str]:
     """Load documents from hard drive"""
     print("start load documents...", file=sys.stderr)
-    data = []
-    with open(filepath, encoding="utf_8") as file:
-        line = file.readline()
-        while line:
-            data.append(line.rstrip("\n"))
-            line = file.readline()
+    return list(iter_documents(filepath))
+
+
+def _build_inverted_index_dict(documents: List[str], tokenizer: Tokenizer) -> Dict[str, List[str]]:
+    vocabulary = Vocabulary()
+    term_postings = []
+
+    for document in documents:
+        document_id, words = tokenizer.split_document(document)
+        term_ids = set(map(vocabulary.intern, words))
+        term_postings.extend([] for _ in range(len(vocabulary) - len(term_postings)))
+        for term_id in term_ids:
+            term_postings[term_id].append(document_id)
+
+    return {
+        word: sorted(set(doc_ids), key=int)
+        for word, doc_ids in zip(vocabulary.words, term_postings)
+    }
 
-    return data
 
+def build_inverted_index(
+        documents: List[str], with_frequencies: bool = False, with_positions: bool = False,
+        tokenizer: Tokenizer = None,
+) -> InvertedIndex:
+    """Build inverted index from array of documents
 
-def build_inverted_index(documents: List[str]) -> InvertedIndex:
-    """Build inverted index from array of documents"""
+    Document ids are integers, posting lists are sorted by document id.
+    with_frequencies: also count term frequencies and document lengths for query_ranked.
+    with_positions: also store positions of words for query_phrase.
+    tokenizer: normalization of words, it is stored with index and applied to queries.
+    """
     print("start build inverted index...", file=sys.stderr)
-    inv_idx_dict = defaultdict(set)
+    tokenizer = tokenizer or Tokenizer()
+    inv_idx = InvertedIndex()
+    inv_idx.tokenizer = tokenizer
+    inv_idx.set_inverted_index_dict(_build_inverted_index_dict(documents, tokenizer))
+    if with_frequencies:
+        inv_idx.bm25_statistics = Bm25Statistics.from_documents(documents, tokenizer)
+    if with_positions:
+        inv_idx.positional_postings = PositionalPostings.from_documents(documents, tokenizer)
+
+    return inv_idx
+
+
+def split_file_into_chunks(filepath: str, num_chunks: int) -> List[Tuple[int, int]]:
+    """Split file into byte ranges [start, end) which begin at the start of a line"""
+    file_size = os.path.getsize(filepath)
+    boundaries = [0]
+    with open(filepath, "rb") as file:
+        for chunk_num in range(1, num_chunks):
+            file.seek(max(file_size * chunk_num // num_chunks, boundaries[-1]))
+            if file.tell() > 0:
+                file.seek(file.tell() - 1)
+                file.readline()
+            boundaries.append(file.tell())
+
+    boundaries.append(file_size)
+    return [
+        (start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end
+    ]
+
+
+def _build_inverted_index_dict_from_chunk(chunk) -> Dict[str, List[str]]:
+    """Build inverted index dict from documents in byte range of file"""
+    filepath, start, end, tokenizer = chunk
+    documents = []
+    with open(filepath, "rb") as file:
+        file.seek(start)
+        while file.tell() < end:
+            documents.append(file.readline().decode("utf_8").rstrip("\n"))
+
+    return _build_inverted_index_dict(documents, tokenizer)
+
+
+def merge_inverted_index_dicts(inv_idx_dicts: List[Dict[str, List[str]]]) -> Dict[str, List[str]]:
+    """Merge inverted index dicts built from consecutive parts of dataset
+
+    Words keep the order of their first occurrence, sorted posting lists are k-way merged.
+    """
+    word_to_postings = defaultdict(list)
+    for inv_idx_dict in inv_idx_dicts:
+        for word, doc_ids in inv_idx_dict.items():
+            word_to_postings[word].append(doc_ids)
+
+    inv_idx_dict = {}
+    for word, postings in word_to_postings.items():
+        doc_ids = []
+        for doc_id in merge(*postings, key=int):
+            if not doc_ids or doc_ids[-1] != doc_id:
+                doc_ids.append(doc_id)
+        inv_idx_dict[word] = doc_ids
+
+    return inv_idx_dict
 
-    for document in documents:
-        document_id, *data = document.split()
-        for word in data:
-            document_id = document_id.strip()
-            inv_idx_dict[word].add(document_id)
 
-    inv_idx_dict = dict(inv_idx_dict)
-    for key in inv_idx_dict.keys():
-        inv_idx_dict[key] = list(inv_idx_dict[key])
+def build_inverted_index_parallel(filepath: str, workers: int, tokenizer: Tokenizer = None) -> InvertedIndex:
+    """Build inverted index from dataset file on a pool of processes
+
+    Dataset is split into byte ranges, every process builds an inverted index
+    for its range and the results are merged. The result is the same as
+    build_inverted_index(load_documents(filepath)).
+    """
+    if not is_seekable_dataset(filepath):
+        raise ValueError("parallel build needs an uncompressed dataset file, not stdin")
+
+    print(f"start build inverted index with {workers} workers...", file=sys.stderr)
+    tokenizer = tokenizer or Tokenizer()
+    chunks = [
+        (filepath, start, end, tokenizer)
+        for start, end in split_file_into_chunks(filepath, workers)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        inv_idx_dicts = list(executor.map(_build_inverted_index_dict_from_chunk, chunks))
 
     inv_idx = InvertedIndex()
-    inv_idx.set_inverted_index_dict(inv_idx_dict)
+    inv_idx.tokenizer = tokenizer
+    inv_idx.set_inverted_index_dict(merge_inverted_index_dicts(inv_idx_dicts))
 
     return inv_idx
 
 
+class SegmentedInvertedIndex:
+    """Inverted index with append-only delta segments
+
+    Main index file is the first segment. Added documents are built into a new
+    segment file, deleted documents are marked in tombstones of segments,
+    so an update costs time proportional to the change. Document which is
+    added again is marked deleted in all previous segments.
+    Segments are described in manifest "<index>.segments.json" and merged
+    back into the main file by compact().
+
+    Scores of query_ranked are computed with statistics of the segment.
+
+    main methods:
+    - query(words: List[str]) -> List[str]
+    - query_phrase(words: List[str], slop: int) -> List[str]
+    - query_boolean(query: str, limit: int) -> List[str]
+    - query_ranked(words: List[str], top_k: int) -> List[Tuple[str, float]]
+    - add_documents(documents: List[str])
+    - delete_documents(document_ids: List[str])
+    - compact()
+    """
+    def __init__(self, filepath: str, storage_policy=None):
+        self.filepath = filepath
+        self.storage_policy = storage_policy
+        self.segments = []
+        self.tombstones = []
+        self._indexes = []
+
+    @property
+    def manifest_filepath(self) -> str:
+        return f"{self.filepath}{SEGMENTS_MANIFEST_SUFFIX}"
+
+    def _segment_filepath(self, segment: str) -> str:
+        return os.path.join(os.path.dirname(os.path.abspath(self.filepath)), segment)
+
+    @classmethod
+    def load(cls, filepath: str, storage_policy=None):
+        """Load main index and its delta segments if manifest exists"""
+        inv_index = cls(os.fspath(filepath), storage_policy)
+        if os.path.exists(inv_index.manifest_filepath):
+            with open(inv_index.manifest_filepath) as manifest_file:
+                manifest = json.load(manifest_file)
+            inv_index.storage_policy = manifest["storage_policy"]
+            inv_index.segments = [segment["path"] for segment in manifest["segments"]]
+            inv_index.tombstones = [set(segment["deleted"]) for segment in manifest["segments"]]
+        else:
+            inv_index.storage_policy = storage_policy or detect_storage_policy(inv_index.filepath)
+            inv_index.segments = [os.path.basename(inv_index.filepath)]
+            inv_index.tombstones = [set()]
+
+        inv_index._indexes = [
+            InvertedIndex.load(inv_index._segment_filepath(segment), inv_index.storage_policy)
+            for segment in inv_index.segments
+        ]
+        return inv_index
+
+    def _dump_manifest(self):
+        manifest = {
+            "storage_policy": self.storage_policy,
+            "segments": [
+                {"path": segment, "deleted": sorted(tombstones)}
+                for segment, tombstones in zip(self.segments, self.tombstones)
+            ],
+        }
+        with open(self.manifest_filepath, "w") as manifest_file:
+            json.dump(manifest, manifest_file)
+
+    def query(self, words: List[str]) -> List[str]:
+        """Return the list of relevant documents for the given query across segments"""
+        doc_ids = []
+        for inv_index, tombstones in zip(self._indexes, self.tombstones):
+            doc_ids.append([
+                doc_id for doc_id in inv_index._query_postings(words) if doc_id not in tombstones
+            ])
+
+        return [str(doc_id) for doc_id in merge(*doc_ids)]
+
+    def query_phrase(self, words: List[str], slop: int = 0) -> List[str]:
+        """Return documents with the phrase across segments, every segment should be built with positions"""
+        doc_ids = []
+        for inv_index, tombstones in zip(self._indexes, self.tombstones):
+            doc_ids.append([
+                doc_id for doc_id in inv_index.query_phrase(words, slop) if int(doc_id) not in tombstones
+            ])
+
+        return list(merge(*doc_ids, key=int))
+
+    def query_boolean(self, query: str, limit: int = None) -> List[str]:
+        """Return the first limit documents matching boolean query across segments"""
+        node = parse_query(query)
+        doc_ids = []
+        for inv_index, tombstones in zip(self._indexes, self.tombstones):
+            iterator = build_iterator(node, inv_index._make_word_iterator)
+            doc_ids.append(filterfalse(tombstones.__contains__, iterate_documents(iterator)))
+
+        return [str(doc_id) for doc_id in islice(merge(*doc_ids), limit)]
+
+    def query_ranked(self, words: List[str], top_k: int = DEFAULT_TOP_K) -> List[Tuple[str, float]]:
+        """Return top_k documents ranked by BM25 across segments, ties by document id
+
+        Every segment returns top_k documents plus the number of its deleted
+        documents, so deleted documents can not push live ones out of top_k.
+        """
+        results = []
+        for inv_index, tombstones in zip(self._indexes, self.tombstones):
+            results.extend(
+                (doc_id, score)
+                for doc_id, score in inv_index.query_ranked(words, top_k + len(tombstones))
+                if int(doc_id) not in tombstones
+            )
+
+        return nsmallest(top_k, results, key=lambda result: (-result[1], int(result[0])))
+
+    def add_documents(self, documents: List[str]):
+        """Add documents as a new segment, previous versions of documents are deleted
+
+        Segment stores frequencies and positions if the main index has them.
+        """
+        main_index = self._indexes[0] if self._indexes else InvertedIndex()
+        tokenizer = main_index.tokenizer
+        inv_index = build_inverted_index(
+            documents, with_frequencies=main_index.bm25_statistics is not None,
+            with_positions=main_index.positional_postings is not None, tokenizer=tokenizer,
+        )
+        doc_ids = {int(tokenizer.split_document(document)[0]) for document in documents}
+        for tombstones in self.tombstones:
+            tombstones.update(doc_ids)
+
+        segment = f"{os.path.basename(self.filepath)}.seg{len(self.segments)}"
+        while os.path.exists(self._segment_filepath(segment)):
+            segment += "_"
+        inv_index.dump(self._segment_filepath(segment), self.storage_policy)
+        self.segments.append(segment)
+        self.tombstones.append(set())
+        self._indexes.append(inv_index)
+        self._dump_manifest()
+
+    def delete_documents(self, document_ids: List[str]):
+        """Mark documents as deleted in all segments"""
+        for tombstones in self.tombstones:
+            tombstones.update(map(int, document_ids))
+        self._dump_manifest()
+
+    def _compact_bm25_statistics(self):
+        """Merge statistics of live documents of segments, None if a segment has no statistics"""
+        if any(inv_index.bm25_statistics is None for inv_index in self._indexes):
+            return None
+
+        doc_lengths = {}
+        word_frequencies = defaultdict(list)
+        for inv_index, tombstones in zip(self._indexes, self.tombstones):
+            statistics = inv_index.bm25_statistics
+            doc_lengths.update(
+                (doc_id, length) for doc_id, length in statistics.doc_lengths.items()
+                if doc_id not in tombstones
+            )
+            for word, frequencies in statistics.term_frequencies.items():
+                word_frequencies[word].extend(
+                    (int(doc_id), frequency)
+                    for doc_id, frequency in zip(inv_index._get_postings(word), frequencies)
+                    if int(doc_id) not in tombstones
+                )
+
+        term_frequencies = {
+            word: array("I", (frequency for _, frequency in sorted(frequencies)))
+            for word, frequencies in word_frequencies.items() if frequencies
+        }
+        return Bm25Statistics(doc_lengths, term_frequencies)
+
+    def _compact_positional_postings(self):
+        """Merge positions of live documents of segments, None if a segment has no positions"""
+        if any(inv_index.positional_postings is None for inv_index in self._indexes):
+            return None
+
+        positions = defaultdict(dict)
+        for inv_index, tombstones in zip(self._indexes, self.tombstones):
+            for word, doc_positions in inv_index.positional_postings.positions.items():
+                positions[word].update(
+                    (doc_id, encoded_positions) for doc_id, encoded_positions in doc_positions.items()
+                    if doc_id not in tombstones
+                )
+
+        return PositionalPostings({
+            word: dict(sorted(doc_positions.items()))
+            for word, doc_positions in positions.items() if doc_positions
+        })
+
+    def compact(self):
+        """Merge all segments without deleted documents into the main index file
+
+        Term frequencies and positions are merged too if every segment has them,
+        files of other segments and stale files next to the main index are removed.
+        """
+        print("start compact inverted index...", file=sys.stderr)
+        inv_idx_dicts = []
+        for inv_index, tombstones in zip(self._indexes, self.tombstones):
+            inv_idx_dict = {}
+            for word, doc_ids in inv_index.inv_idx_dict.items():
+                doc_ids = [doc_id for doc_id in doc_ids if int(doc_id) not in tombstones]
+                if doc_ids:
+                    inv_idx_dict[word] = doc_ids
+            inv_idx_dicts.append(inv_idx_dict)
+
+        inv_index = InvertedIndex()
+        inv_index.tokenizer = self._indexes[0].tokenizer
+        inv_index.set_inverted_index_dict(merge_inverted_index_dicts(inv_idx_dicts))
+        inv_index.bm25_statistics = self._compact_bm25_statistics()
+        inv_index.positional_postings = self._compact_positional_postings()
+        compacted_filepath = f"{self.filepath}.compact"
+        inv_index.dump(compacted_filepath, self.storage_policy)
+        os.replace(compacted_filepath, self.filepath)
+        for suffix in SIDECAR_SUFFIXES:
+            if os.path.exists(f"{compacted_filepath}{suffix}"):
+                os.replace(f"{compacted_filepath}{suffix}", f"{self.filepath}{suffix}")
+            elif os.path.exists(f"{self.filepath}{suffix}"):
+                os.remove(f"{self.filepath}{suffix}")
+
+        for segment in self.segments[1:]:
+            segment_filepath = self._segment_filepath(segment)
+            for filepath in [segment_filepath] + [f"{segment_filepath}{suffix}" for suffix in SIDECAR_SUFFIXES]:
+                if os.path.exists(filepath):
+                    os.remove(filepath)
+        if os.path.exists(self.manifest_filepath):
+            os.remove(self.manifest_filepath)
+        self.segments = [os.path.basename(self.filepath)]
+        self.tombstones = [set()]
+        self._indexes = [inv_index]
+
+
+class ShardedInvertedIndex:
+    """Inverted index partitioned by ranges of document ids into shard files
+
+    Shards are described in manifest "<index>.shards.json", every shard is
+    an ordinary inverted index file. Queries fan out to shards on a pool of
+    threads, results of shards are concatenated in order of ranges.
+    Scores of query_ranked are computed with statistics of the shard.
+
+    main methods:
+    - query(words: List[str]) -> List[str]
+    - query_phrase(words: List[str], slop: int) -> List[str]
+    - query_boolean(query: str, limit: int) -> List[str]
+    - query_ranked(words: List[str], top_k: int) -> List[Tuple[str, float]]
+    - load(filepath: str, storage_policy=None, workers=None) (classmethod)
+    """
+    def __init__(self, filepath: str, shards: List[Dict], indexes: List[InvertedIndex], workers: int = None):
+        self.filepath = filepath
+        self.shards = shards
+        self._indexes = indexes
+        self._executor = ThreadPoolExecutor(max_workers=workers or max(len(indexes), 1))
+
+    @staticmethod
+    def manifest_filepath(filepath: str) -> str:
+        return f"{filepath}{SHARDS_MANIFEST_SUFFIX}"
+
+    @classmethod
+    def load(cls, filepath: str, storage_policy=None, workers: int = None):
+        """Load all shards of manifest in parallel"""
+        filepath = os.fspath(filepath)
+        with open(cls.manifest_filepath(filepath)) as manifest_file:
+            manifest = json.load(manifest_file)
+
+        shards_dir = os.path.dirname(os.path.abspath(filepath))
+        storage_policy = storage_policy or manifest["storage_policy"]
+        with ThreadPoolExecutor(max_workers=workers or max(len(manifest["shards"]), 1)) as executor:
+            indexes = list(executor.map(
+                lambda shard: InvertedIndex.load(os.path.join(shards_dir, shard["path"]), storage_policy),
+                manifest["shards"],
+            ))
+
+        return cls(filepath, manifest["shards"], indexes, workers)
+
+    def _scatter(self, method: str, *args) -> List:
+        return list(self._executor.map(lambda inv_index: getattr(inv_index, method)(*args), self._indexes))
+
+    def query(self, words: List[str]) -> List[str]:
+        """Return the list of relevant documents for the given query across shards"""
+        return [doc_id for doc_ids in self._scatter("query", words) for doc_id in doc_ids]
+
+    def query_phrase(self, words: List[str], slop: int = 0) -> List[str]:
+        return [doc_id for doc_ids in self._scatter("query_phrase", words, slop) for doc_id in doc_ids]
+
+    def query_boolean(self, query: str, limit: int = None) -> List[str]:
+        """Return the first limit documents of shards in order of ranges"""
+        doc_ids = [doc_id for doc_ids in self._scatter("query_boolean", query, limit) for doc_id in doc_ids]
+        return doc_ids if limit is None else doc_ids[:limit]
+
+    def query_ranked(self, words: List[str], top_k: int = DEFAULT_TOP_K) -> List[Tuple[str, float]]:
+        """Return top_k of top_k documents of every shard, ties by document id"""
+        results = [result for results in self._scatter("query_ranked", words, top_k) for result in results]
+        return nsmallest(top_k, results, key=lambda result: (-result[1], int(result[0])))
+
+    def close(self):
+        self._executor.shutdown()
+
+
+def _split_documents_into_shards(documents: List[str], num_shards: int, tokenizer: Tokenizer) -> List[List[str]]:
+    """Split documents into num_shards parts by consecutive ranges of document ids"""
+    documents = sorted(documents, key=lambda document: int(tokenizer.split_document(document)[0]))
+    doc_ids = [int(tokenizer.split_document(document)[0]) for document in documents]
+    shards = []
+    start = 0
+    for shard_num in range(1, num_shards + 1):
+        end = len(documents) * shard_num // num_shards
+        # documents with the same id stay in one shard
+        while 0 < end < len(documents) and doc_ids[end] == doc_ids[end - 1]:
+            end += 1
+        if start < end:
+            shards.append(documents[start:end])
+        start = max(start, end)
+
+    return shards
+
+
+def _build_shard(shard) -> Dict:
+    """Build inverted index of shard documents and dump it, return manifest entry"""
+    documents, filepath, storage_policy, with_frequencies, with_positions, tokenizer = shard
+    inv_index = build_inverted_index(
+        documents, with_frequencies=with_frequencies, with_positions=with_positions, tokenizer=tokenizer,
+    )
+    inv_index.dump(filepath, storage_policy)
+    doc_ids = [int(tokenizer.split_document(document)[0]) for document in (documents[0], documents[-1])]
+    return {"path": os.path.basename(filepath), "min_doc_id": doc_ids[0], "max_doc_id": doc_ids[1]}
+
+
+def build_sharded_inverted_index(
+        documents: List[str], output_filepath: str, num_shards: int,
+        storage_policy="array_storage_policy", workers: int = 1,
+        with_frequencies: bool = False, with_positions: bool = False, tokenizer: Tokenizer = None,
+):
+    """Build inverted index of num_shards shard files and their manifest
+
+    Documents are split by ranges of document ids with equal number of documents,
+    shards are built on a pool of workers processes.
+    Index is loaded by load_inverted_index(output_filepath).
+    """
+    print(f"start build {num_shards} shards of inverted index...", file=sys.stderr)
+    tokenizer = tokenizer or Tokenizer()
+    output_filepath = os.fspath(output_filepath)
+    shards = [
+        (shard_documents, f"{output_filepath}.shard{shard_num}", storage_policy,
+         with_frequencies, with_positions, tokenizer)
+        for shard_num, shard_documents in enumerate(
+            _split_documents_into_shards(documents, num_shards, tokenizer)
+        )
+    ]
+    with ProcessPoolExecutor(max_workers=max(workers, 1)) as executor:
+        manifest_shards = list(executor.map(_build_shard, shards))
+
+    with open(ShardedInvertedIndex.manifest_filepath(output_filepath), "w") as manifest_file:
+        json.dump({"storage_policy": storage_policy, "shards": manifest_shards}, manifest_file)
+
+
+def load_inverted_index(filepath: str, storage_policy=None):
+    """Load inverted index, with delta segments or shards if the index has them"""
+    if os.path.exists(ShardedInvertedIndex.manifest_filepath(filepath)):
+        return ShardedInvertedIndex.load(filepath, storage_policy)
+
+    if os.path.exists(f"{filepath}{SEGMENTS_MANIFEST_SUFFIX}"):
+        return SegmentedInvertedIndex.load(filepath, storage_policy)
+
+    return InvertedIndex.load(filepath, storage_policy)
+
+
+def build_inverted_index_external(
+        filepath: str, output_filepath: str, memory_limit: int,
+        storage_policy="mmap_storage_policy", tokenizer: Tokenizer = None,
+):
+    """Build inverted index from dataset file which does not fit in memory
+
+    Documents are read lazily. When estimated size of posting lists in memory
+    reaches memory_limit bytes, they are spilled to a sorted run file in
+    a temporary directory. Runs are k-way merged into output_filepath.
+    Storage policy should be able to dump sorted items: compressed or mmap.
+    """
+    policy = get_storage_policy(storage_policy)
+    if not hasattr(policy, "dump_sorted_items"):
+        raise ValueError(f"{storage_policy} can not be used for external build")
+
+    tokenizer = tokenizer or Tokenizer()
+    print("start external build inverted index...", file=sys.stderr)
+    with TemporaryDirectory() as runs_dir:
+        run_filepaths = []
+
+        def spill(inv_idx_dict):
+            run_filepath = os.path.join(runs_dir, f"run_{len(run_filepaths)}")
+            write_run(inv_idx_dict, run_filepath)
+            run_filepaths.append(run_filepath)
+
+        inv_idx_dict = defaultdict(set)
+        memory_estimate = 0
+        for document in iter_documents(filepath):
+            document_id, words = tokenizer.split_document(document)
+            document_id = int(document_id)
+            for word in words:
+                postings = inv_idx_dict[word]
+                if not postings:
+                    memory_estimate += TERM_MEMORY_ESTIMATE + len(word)
+                if document_id not in postings:
+                    postings.add(document_id)
+                    memory_estimate += POSTING_MEMORY_ESTIMATE
+
+            if memory_estimate >= memory_limit:
+                spill(inv_idx_dict)
+                inv_idx_dict = defaultdict(set)
+                memory_estimate = 0
+
+        if inv_idx_dict or not run_filepaths:
+            spill(inv_idx_dict)
+
+        print(f"start merge {len(run_filepaths)} runs...", file=sys.stderr)
+        policy.dump_sorted_items(merge_runs(run_filepaths), output_filepath)
+
+    if not tokenizer.is_default:
+        tokenizer.dump(f"{output_filepath}{TOKENIZER_SUFFIX}")
+
+
+def _get_stage_stats(arguments) -> StageStats:
+    return getattr(arguments, "stage_stats", None) or StageStats(enabled=False)
+
+
 def callback_build(arguments):
     """Callback for method build"""
-    documents = load_documents(arguments.path_to_dataset)
-    inverted_index = build_inverted_index(documents)
-    inverted_index.dump(arguments.path_to_load)
+    stage_stats = _get_stage_stats(arguments)
+    tokenizer = Tokenizer(
+        lowercase=arguments.lowercase, strip_punctuation=arguments.strip_punctuation,
+        stemmer=arguments.stemmer,
+    )
+    for flag, enabled in [("--with-frequencies", arguments.with_frequencies),
+                          ("--with-positions", arguments.with_positions)]:
+        if enabled and arguments.shards <= 1 and (arguments.memory_limit is not None or arguments.workers > 1):
+            raise ValueError(f"{flag} can not be used with --memory-limit or --workers without --shards")
+    if arguments.shards > 1:
+        if arguments.memory_limit is not None:
+            raise ValueError("--memory-limit can not be used with --shards")
+        with stage_stats.stage("load_documents") as counts:
+            documents = load_documents(arguments.path_to_dataset)
+            counts["documents"] = len(documents)
+        with stage_stats.stage("build_shards") as counts:
+            build_sharded_inverted_index(
+                documents, arguments.path_to_load, arguments.shards,
+                storage_policy=arguments.storage_policy, workers=arguments.workers,
+                with_frequencies=arguments.with_frequencies, with_positions=arguments.with_positions,
+                tokenizer=tokenizer,
+            )
+            counts["shards"] = arguments.shards
+        return
+
+    if arguments.memory_limit is not None:
+        with stage_stats.stage("build_external") as counts:
+            build_inverted_index_external(
+                arguments.path_to_dataset, arguments.path_to_load,
+                memory_limit=arguments.memory_limit * 2 ** 20,
+                storage_policy=arguments.storage_policy, tokenizer=tokenizer,
+            )
+            counts["bytes"] = os.path.getsize(arguments.path_to_load)
+        return
+
+    if arguments.workers > 1:
+        with stage_stats.stage("build_parallel") as counts:
+            inverted_index = build_inverted_index_parallel(
+                arguments.path_to_dataset, arguments.workers, tokenizer=tokenizer
+            )
+            counts["terms"] = len(inverted_index.inv_idx_dict)
+    else:
+        with stage_stats.stage("load_documents") as counts:
+            documents = load_documents(arguments.path_to_dataset)
+            counts["documents"] = len(documents)
+        with stage_stats.stage("build") as counts:
+            inverted_index = build_inverted_index(
+                documents, with_frequencies=arguments.with_frequencies,
+                with_positions=arguments.with_positions, tokenizer=tokenizer,
+            )
+            counts["terms"] = len(inverted_index.inv_idx_dict)
+    with stage_stats.stage("dump") as counts:
+        inverted_index.dump(arguments.path_to_load, storage_policy=arguments.storage_policy)
+        counts["bytes"] = os.path.getsize(arguments.path_to_load)
+
+
+def run_query_batch(
+        inverted_index: InvertedIndex, queries: List[List[str]], output,
+        cache_size: int = DEFAULT_QUERY_CACHE_SIZE, top_k: int = None, phrase_slop: int = None,
+        stage_stats: StageStats = None, boolean: bool = False, limit: int = None,
+):
+    """Run queries against inverted index and write one result line per query
+
+    Queries are normalized to a set of words and their results are memoized
+    in LRU cache of cache_size entries, posting list of every distinct word
+    is decoded once. Results are written to output in chunks of lines.
+    If top_k is given, top_k documents ranked by BM25 are written in rank order.
+    If phrase_slop is given, every query is a phrase with at most phrase_slop words between neighbours.
+    If stage_stats is given, every query is recorded as a stage.
+    If boolean is set, words of every query form a boolean query, at most limit documents are written.
+    """
+    @lru_cache(maxsize=cache_size)
+    def cached_query(words) -> str:
+        if boolean:
+            return ",".join(inverted_index.query_boolean(" ".join(words), limit))
+        if phrase_slop is not None:
+            return ",".join(inverted_index.query_phrase(list(words), phrase_slop))
+        if top_k is not None:
+            return ",".join(doc_id for doc_id, _ in inverted_index.query_ranked(list(words), top_k))
+        return ",".join(inverted_index.query(list(words)))
+
+    lines = []
+    for query in queries:
+        key = tuple(query) if phrase_slop is not None or boolean else frozenset(query)
+        if stage_stats is None:
+            lines.append(cached_query(key))
+        else:
+            with stage_stats.stage("query") as counts:
+                lines.append(cached_query(key))
+                counts["words"] = len(query)
+                counts["results"] = lines[-1].count(",") + 1 if lines[-1] else 0
+        if len(lines) == QUERY_OUTPUT_CHUNK_SIZE:
+            output.write("\n".join(lines) + "\n")
+            lines = []
+
+    if lines:
+        output.write("\n".join(lines) + "\n")
+
+
+def _load_inverted_index_stage(arguments, loader=None):
+    """Load inverted index of arguments as stage load_index"""
+    loader = loader or load_inverted_index
+    with _get_stage_stats(arguments).stage("load_index"):
+        return loader(arguments.path_to_inv_index, storage_policy=arguments.storage_policy)
 
 
 def callback_query(arguments):
     """Callback for method query"""
-    inverted_index = InvertedIndex.load(arguments.path_to_inv_index)
+    stage_stats = _get_stage_stats(arguments)
+    inverted_index = _load_inverted_index_stage(arguments)
     queries = []
     if arguments.queries:
         queries = arguments.queries
     elif arguments.query_file:
         queries = [el.strip().split() for el in arguments.query_file]
 
-    for query in queries:
-        document_ids = inverted_index.query(query)
-        print(",".join(document_ids), file=sys.stdout)
+    if arguments.explain:
+        if not hasattr(inverted_index, "explain"):
+            raise ValueError("explain is supported only for inverted index of one file")
+        for query in queries:
+            print(json.dumps(inverted_index.explain(query)), file=sys.stdout)
+        return
+
+    run_query_batch(
+        inverted_index, queries, sys.stdout,
+        cache_size=arguments.cache_size, top_k=arguments.top_k,
+        phrase_slop=arguments.slop if arguments.phrase else None,
+        stage_stats=stage_stats if stage_stats.enabled else None,
+        boolean=arguments.boolean, limit=arguments.limit,
+    )
+
+
+def callback_verify(arguments):
+    """Callback for method verify"""
+    header = verify_index_file(arguments.path_to_inv_index)
+    print(json.dumps({
+        "storage_policy": detect_storage_policy(arguments.path_to_inv_index),
+        "format_version": header.version,
+        "num_terms": header.num_terms,
+        "payload_length": header.payload_length,
+    }), file=sys.stdout)
+
+
+def callback_add(arguments):
+    """Callback for method add"""
+    inverted_index = _load_inverted_index_stage(arguments, SegmentedInvertedIndex.load)
+    with _get_stage_stats(arguments).stage("add_documents") as counts:
+        documents = load_documents(arguments.path_to_dataset)
+        inverted_index.add_documents(documents)
+        counts["documents"] = len(documents)
+
+
+def callback_delete(arguments):
+    """Callback for method delete"""
+    inverted_index = _load_inverted_index_stage(arguments, SegmentedInvertedIndex.load)
+    with _get_stage_stats(arguments).stage("delete_documents") as counts:
+        inverted_index.delete_documents(arguments.document_ids)
+        counts["documents"] = len(arguments.document_ids)
+
+
+def callback_compact(arguments):
+    """Callback for method compact"""
+    inverted_index = _load_inverted_index_stage(arguments, SegmentedInvertedIndex.load)
+    with _get_stage_stats(arguments).stage("compact") as counts:
+        counts["segments"] = len(inverted_index.segments)
+        inverted_index.compact()
+
+
+def callback_serve(arguments):
+    """Callback for method serve"""
+    inverted_index = _load_inverted_index_stage(arguments)
+    server = make_server(inverted_index, arguments.host, arguments.port)
+    print(f"serve inverted index on {arguments.host}:{arguments.port}...", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def callback_client(arguments):
+    """Callback for method client"""
+    client = InvertedIndexClient(arguments.host, arguments.port)
+    try:
+        if arguments.benchmark:
+            latency = measure_latency(client, arguments.queries, repeat=arguments.benchmark)
+            print(json.dumps(latency), file=sys.stdout)
+        else:
+            for query in arguments.queries:
+                print(",".join(client.query(query)), file=sys.stdout)
+    finally:
+        client.close()
 
 
 def setup_parser(parser):
@@ -144,12 +1155,53 @@ def setup_parser(parser):
     )
     build_parser.add_argument(
         "-d", "--dataset", required=True, dest="path_to_dataset",
-        help="path to dataset to load",
+        help="path to dataset to load, gzip and zstandard are decompressed, - for stdin",
     )
     build_parser.add_argument(
         "-o", "--output", required=True,
         help="path to store inverted index", dest="path_to_load"
     )
+    build_parser.add_argument(
+        "--storage-policy", default="compressed_storage_policy", choices=list(STORAGE_POLICIES),
+        help="format to store inverted index, array_storage_policy is limited to document ids below 32768",
+    )
+    build_parser.add_argument(
+        "--with-frequencies", action="store_true",
+        help="store term frequencies and document lengths for ranked queries, "
+             "not supported by --memory-limit and --workers without --shards",
+    )
+    build_parser.add_argument(
+        "--with-positions", action="store_true",
+        help="store positions of words for phrase queries, "
+             "not supported by --memory-limit and --workers without --shards",
+    )
+    build_parser.add_argument(
+        "--lowercase", action="store_true",
+        help="translate words of documents and queries to lowercase",
+    )
+    build_parser.add_argument(
+        "--strip-punctuation", action="store_true",
+        help="treat punctuation in documents and queries as whitespace",
+    )
+    build_parser.add_argument(
+        "--stemmer", default=None, choices=sorted(STEMMERS),
+        help="stem words of documents and queries",
+    )
+    build_mode_group = build_parser.add_mutually_exclusive_group(required=False)
+    build_mode_group.add_argument(
+        "--workers", default=1, type=int,
+        help="number of processes to build inverted index",
+    )
+    build_mode_group.add_argument(
+        "--memory-limit", default=None, type=int, metavar="MB",
+        help="build with bounded memory spilling to temporary files, "
+             "only for compressed_storage_policy and mmap_storage_policy",
+    )
+    build_parser.add_argument(
+        "--shards", default=1, type=int,
+        help="partition inverted index by ranges of document ids into SHARDS files "
+             "described by manifest <output>.shards.json, --workers processes build shards",
+    )
     build_parser.set_defaults(callback=callback_build)
 
     query_parser = subparsers.add_parser(
@@ -160,6 +1212,10 @@ def setup_parser(parser):
         "-i", "--index", required=True, dest="path_to_inv_index",
         help="path to inverted index"
     )
+    query_parser.add_argument(
+        "--storage-policy", default=None, choices=list(STORAGE_POLICIES),
+        help="format of stored inverted index, detected by header of file by default",
+    )
     query_file_group = query_parser.add_mutually_exclusive_group(required=False)
     query_file_group.add_argument(
         "--query-file-utf8", required=False, dest="query_file",
@@ -176,8 +1232,127 @@ def setup_parser(parser):
         metavar="WORD",
         help="query to run against inverted index"
     )
+    query_parser.add_argument(
+        "--cache-size", default=DEFAULT_QUERY_CACHE_SIZE, type=int,
+        help="number of query results to memoize, 0 to disable",
+    )
+    query_parser.add_argument(
+        "--top-k", default=None, type=int,
+        help="return top K documents containing any word ranked by BM25, "
+             "index should be built with --with-frequencies",
+    )
+    query_parser.add_argument(
+        "--phrase", action="store_true",
+        help="every query is a phrase, index should be built with --with-positions",
+    )
+    query_parser.add_argument(
+        "--slop", default=0, type=int,
+        help="number of other words allowed between neighbour words of phrase",
+    )
+    query_parser.add_argument(
+        "--boolean", action="store_true",
+        help="every query is a boolean query with AND, OR, NOT and parentheses, e.g. 'a AND (b OR c) AND NOT d'",
+    )
+    query_parser.add_argument(
+        "--limit", default=None, type=int,
+        help="return at most LIMIT first documents of boolean query",
+    )
+    query_parser.add_argument(
+        "--explain", action="store_true",
+        help="print plan of every query with estimated and actual result sizes in json",
+    )
     query_parser.set_defaults(callback=callback_query)
 
+    add_parser = subparsers.add_parser(
+        "add",
+        help="add documents to inverted index as a delta segment"
+    )
+    add_parser.add_argument(
+        "-d", "--dataset", required=True, dest="path_to_dataset",
+        help="path to dataset with documents to add",
+    )
+    add_parser.set_defaults(callback=callback_add)
+
+    delete_parser = subparsers.add_parser(
+        "delete",
+        help="mark documents of inverted index as deleted"
+    )
+    delete_parser.add_argument(
+        "--document-id", required=True, nargs="+", dest="document_ids",
+        help="ids of documents to delete",
+    )
+    delete_parser.set_defaults(callback=callback_delete)
+
+    compact_parser = subparsers.add_parser(
+        "compact",
+        help="merge delta segments into the main inverted index file"
+    )
+    compact_parser.set_defaults(callback=callback_compact)
+
+    for update_parser in (add_parser, delete_parser, compact_parser):
+        update_parser.add_argument(
+            "-i", "--index", required=True, dest="path_to_inv_index",
+            help="path to inverted index"
+        )
+        update_parser.add_argument(
+            "--storage-policy", default=None, choices=list(STORAGE_POLICIES),
+            help="format of stored inverted index, taken from manifest if index has segments, "
+                 "detected by header of file by default",
+        )
+
+    verify_parser = subparsers.add_parser(
+        "verify",
+        help="check header and checksum of binary inverted index file"
+    )
+    verify_parser.add_argument(
+        "-i", "--index", required=True, dest="path_to_inv_index",
+        help="path to inverted index"
+    )
+    verify_parser.set_defaults(callback=callback_verify)
+
+    serve_parser = subparsers.add_parser(
+        "serve",
+        help="load inverted index once and answer queries over HTTP"
+    )
+    serve_parser.add_argument(
+        "-i", "--index", required=True, dest="path_to_inv_index",
+        help="path to inverted index"
+    )
+    serve_parser.add_argument(
+        "--storage-policy", default=None, choices=list(STORAGE_POLICIES),
+        help="format of stored inverted index, detected by header of file by default",
+    )
+    serve_parser.add_argument("--host", default=DEFAULT_HOST, help="host to listen")
+    serve_parser.add_argument("--port", default=DEFAULT_PORT, type=int, help="port to listen")
+    serve_parser.set_defaults(callback=callback_serve)
+
+    client_parser = subparsers.add_parser(
+        "client",
+        help="query inverted index server"
+    )
+    client_parser.add_argument("--host", default=DEFAULT_HOST, help="host of server")
+    client_parser.add_argument("--port", default=DEFAULT_PORT, type=int, help="port of server")
+    client_parser.add_argument(
+        "--query", required=True, nargs="+", dest="queries", action="append",
+        metavar="WORD",
+        help="query to run against inverted index server"
+    )
+    client_parser.add_argument(
+        "--benchmark", default=0, type=int, metavar="REPEAT",
+        help="run queries REPEAT times and print latency statistics in json",
+    )
+    client_parser.set_defaults(callback=callback_client)
+
+    for command_parser in subparsers.choices.values():
+        command_parser.add_argument(
+            "--stats", action="store_true",
+            help="print wall time, CPU time, peak memory and item counts of every stage in json to stderr",
+        )
+        command_parser.add_argument(
+            "--profile", default=None, metavar="FILE",
+            help="run command under cProfile and save profile to FILE (.prof)",
+        )
+
 
 def main():
     parser = ArgumentParser(
@@ -186,7 +1361,19 @@ def main():
     )
     setup_parser(parser)
     arguments = parser.parse_args()
-    arguments.callback(arguments)
+    arguments.stage_stats = StageStats(enabled=arguments.stats)
+    profiler = cProfile.Profile() if arguments.profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        arguments.callback(arguments)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(arguments.profile)
+            print(f"profile is saved to {arguments.profile}", file=sys.stderr)
+        if arguments.stats:
+            print(json.dumps(arguments.stage_stats.to_dict()), file=sys.stderr)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,89 @@
+"""HTTP server and client for inverted index
+
+Server keeps loaded inverted index in memory and answers
+GET /query?word=<word>&word=<word> with comma separated document ids,
+the same way as InvertedIndex.query.
+Connections are kept alive, so the client pays only for the query itself.
+"""
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from statistics import mean, median
+from time import perf_counter
+from typing import Dict, List
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class InvertedIndexRequestHandler(BaseHTTPRequestHandler):
+    """Handler of queries to inverted index stored in server"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path != "/query":
+            self._send(404, "unknown path\n")
+            return
+
+        words = parse_qs(url.query).get("word", [])
+        document_ids = self.server.inverted_index.query(words)
+        self._send(200, ",".join(document_ids) + "\n")
+
+    def _send(self, status: int, text: str):
+        body = text.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_server(inverted_index, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT) -> ThreadingHTTPServer:
+    """Create server which answers queries to inverted_index"""
+    server = ThreadingHTTPServer((host, port), InvertedIndexRequestHandler)
+    server.inverted_index = inverted_index
+    return server
+
+
+class InvertedIndexClient:
+    """Client of inverted index server with a persistent connection"""
+    def __init__(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        self.connection = HTTPConnection(host, port)
+
+    def query(self, words: List[str]) -> List[str]:
+        """Return the list of relevant documents for the given query"""
+        self.connection.request("GET", "/query?" + urlencode({"word": words}, doseq=True))
+        response = self.connection.getresponse()
+        text = response.read().decode().rstrip("\n")
+        if response.status != 200:
+            raise RuntimeError(f"server answered {response.status}: {text}")
+
+        return text.split(",") if text else []
+
+    def close(self):
+        self.connection.close()
+
+
+def measure_latency(client: InvertedIndexClient, queries: List[List[str]], repeat: int = 100) -> Dict[str, float]:
+    """Run every query repeat times and return latency statistics in microseconds"""
+    latencies = []
+    for _ in range(repeat):
+        for query in queries:
+            start = perf_counter()
+            client.query(query)
+            latencies.append((perf_counter() - start) * 1e6)
+
+    latencies.sort()
+    return {
+        "queries": len(latencies),
+        "mean_us": mean(latencies),
+        "median_us": median(latencies),
+        "p99_us": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))],
+        "max_us": latencies[-1],
+    }
@@ -0,0 +1,114 @@
+"""Positional postings for phrase and proximity queries
+
+For every word and document the sorted positions of the word in the document
+are stored compressed by posting_codec and decoded only for documents
+which passed the document level intersection.
+"""
+from collections import defaultdict
+import struct
+from typing import Dict, List
+
+from posting_codec import decode_postings, decode_varint, encode_postings, encode_varint
+from tokenizer import Tokenizer
+
+
+class PositionalPostings:
+    """Compressed positions of words in documents
+
+    main methods:
+    - get_positions(word: str, doc_id: int) -> List[int]
+    - dump(filepath: str), load(filepath: str) (classmethod)
+    """
+    def __init__(self, positions: Dict[str, Dict[int, bytes]]):
+        self.positions = positions
+
+    def __eq__(self, other):
+        return self.positions == other.positions
+
+    @classmethod
+    def from_documents(cls, documents: List[str], tokenizer: Tokenizer = None):
+        """Collect positions of words in documents, the first word after document id has position 0"""
+        tokenizer = tokenizer or Tokenizer()
+        word_positions = defaultdict(lambda: defaultdict(list))
+        for document in documents:
+            document_id, data = tokenizer.split_document(document)
+            document_id = int(document_id)
+            for position, word in enumerate(data):
+                word_positions[word][document_id].append(position)
+
+        return cls({
+            word: {doc_id: encode_postings(positions) for doc_id, positions in doc_positions.items()}
+            for word, doc_positions in word_positions.items()
+        })
+
+    def get_positions(self, word: str, doc_id: int) -> List[int]:
+        """Return sorted positions of word in document"""
+        return decode_postings(self.positions[word][doc_id])
+
+    def dump(self, filepath: str):
+        """Dump positions into binary file
+
+        File layout: number of terms (big-endian uint32) and for every term
+        varint key length, utf-8 key, varint number of documents and for every
+        document varint id, varint length and compressed positions.
+        """
+        content = bytearray(struct.pack(">1I", len(self.positions)))
+        for word, doc_positions in self.positions.items():
+            key = word.encode()
+            encode_varint(len(key), content)
+            content += key
+            encode_varint(len(doc_positions), content)
+            for doc_id, positions in doc_positions.items():
+                encode_varint(doc_id, content)
+                encode_varint(len(positions), content)
+                content += positions
+
+        with open(filepath, "wb") as file:
+            file.write(content)
+
+    @classmethod
+    def load(cls, filepath: str):
+        """Load positions from binary file, positions stay compressed"""
+        with open(filepath, "rb") as file:
+            content = file.read()
+
+        positions = {}
+        num_terms = struct.unpack_from(">1I", content)[0]
+        position = 4
+        for _ in range(num_terms):
+            len_key, position = decode_varint(content, position)
+            word = content[position:position + len_key].decode()
+            position += len_key
+            num_docs, position = decode_varint(content, position)
+            doc_positions = {}
+            for _ in range(num_docs):
+                doc_id, position = decode_varint(content, position)
+                len_positions, position = decode_varint(content, position)
+                doc_positions[doc_id] = content[position:position + len_positions]
+                position += len_positions
+            positions[word] = doc_positions
+
+        return cls(positions)
+
+
+def match_phrase(positions_lists: List[List[int]], slop: int = 0) -> bool:
+    """Check that words occur in order with at most slop other words between neighbours
+
+    positions_lists: sorted positions of every word of phrase in one document.
+    Positions where the phrase can reach the next word are tracked one word at
+    a time, so it costs O(number of positions).
+    """
+    reachable = positions_lists[0]
+    for positions in positions_lists[1:]:
+        next_reachable = []
+        index = 0
+        for position in positions:
+            while index < len(reachable) and reachable[index] < position:
+                index += 1
+            if index and position - reachable[index - 1] <= slop + 1:
+                next_reachable.append(position)
+        if not next_reachable:
+            return False
+        reachable = next_reachable
+
+    return bool(reachable)
@@ -0,0 +1,78 @@
+"""Codec for posting lists
+
+Posting list is sorted, delta encoded and every delta is packed as varint:
+7 bits of value per byte, the high bit is set when more bytes follow.
+Document ids are not limited in size, so 32 and 64 bit ids are supported.
+"""
+from typing import Iterable, List
+
+
+CONTINUATION_BYTES = bytes(range(0x80, 0x100))
+
+
+def encode_varint(value: int, result: bytearray):
+    """Append value as varint to result"""
+    if value < 0:
+        raise ValueError(f"varint can not encode negative value {value}")
+
+    while value >= 0x80:
+        result.append((value & 0x7F) | 0x80)
+        value >>= 7
+    result.append(value)
+
+
+def decode_varint(buffer, position: int):
+    """Decode varint from buffer at position
+
+    return: (value, position after varint)
+    """
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[position]
+        position += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, position
+        shift += 7
+
+
+def encode_postings(doc_ids: Iterable) -> bytes:
+    """Sort document ids, delta encode and pack them as varint"""
+    result = bytearray()
+    previous = 0
+    for doc_id in sorted(map(int, doc_ids)):
+        encode_varint(doc_id - previous, result)
+        previous = doc_id
+
+    return bytes(result)
+
+
+def decode_postings(buffer, start: int = 0, end: int = None) -> List[int]:
+    """Decode sorted document ids from buffer[start:end]"""
+    if end is None:
+        end = len(buffer)
+
+    doc_ids = []
+    doc_id = 0
+    delta = 0
+    shift = 0
+    for byte in buffer[start:end]:
+        delta |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            doc_id += delta
+            doc_ids.append(doc_id)
+            delta = 0
+            shift = 0
+        else:
+            shift += 7
+
+    return doc_ids
+
+
+def count_postings(buffer, start: int = 0, end: int = None) -> int:
+    """Count document ids in buffer[start:end] without decoding: every varint has one byte < 0x80"""
+    if end is None:
+        end = len(buffer)
+
+    return len(bytes(buffer[start:end]).translate(None, CONTINUATION_BYTES))
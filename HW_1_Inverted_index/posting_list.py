@@ -0,0 +1,89 @@
+"""Operations over posting lists
+
+Posting list is a sorted array of signed integer document ids:
+array("q") or numpy array of numpy_storage_policy.
+"""
+from array import array
+from bisect import bisect_left
+from heapq import merge
+from typing import Iterable, List, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only numpy_storage_policy needs it
+    np = None
+
+
+def make_posting_list(doc_ids: Iterable) -> array:
+    """Create sorted posting list from document ids"""
+    return array("q", sorted(map(int, doc_ids)))
+
+
+def gallop(postings: Sequence[int], target: int, low: int = 0) -> int:
+    """Return the first position from low where postings[position] >= target
+
+    Search range grows exponentially, so jumps over long runs cost O(log distance).
+    """
+    step = 1
+    high = low
+    while high < len(postings) and postings[high] < target:
+        low = high + 1
+        high += step
+        step *= 2
+
+    return bisect_left(postings, target, low, min(high, len(postings)))
+
+
+def intersect_sorted(smaller: Sequence[int], larger: Sequence[int]) -> array:
+    """Intersect two posting lists, iterating the smaller one and galloping in the larger"""
+    if np is not None and isinstance(smaller, np.ndarray) and isinstance(larger, np.ndarray):
+        return intersect_arrays(smaller, larger)
+
+    result = array("q")
+    position = 0
+    for doc_id in smaller:
+        position = gallop(larger, doc_id, position)
+        if position == len(larger):
+            break
+        if larger[position] == doc_id:
+            result.append(doc_id)
+
+    return result
+
+
+def intersect_arrays(smaller, larger):
+    """Intersect two sorted numpy posting lists with binary search of every id of the smaller one"""
+    if not len(smaller) or not len(larger):
+        return smaller[:0]
+
+    positions = np.searchsorted(larger, smaller)
+    np.minimum(positions, len(larger) - 1, out=positions)
+    return smaller[larger[positions] == smaller]
+
+
+def intersect_postings(postings_lists: List[Sequence[int]]) -> Sequence[int]:
+    """Intersect posting lists starting from the smallest one"""
+    if not postings_lists:
+        return array("q")
+
+    postings_lists = sorted(postings_lists, key=len)
+    result = postings_lists[0]
+    for postings in postings_lists[1:]:
+        if not len(result):
+            break
+        result = intersect_sorted(result, postings)
+
+    return result
+
+
+def union_postings(postings_lists: List[Sequence[int]]) -> Sequence[int]:
+    """Merge posting lists into one sorted posting list without duplicates"""
+    if np is not None and postings_lists and all(isinstance(postings, np.ndarray) for postings in postings_lists):
+        return np.unique(np.concatenate(postings_lists))
+
+    result = array("q")
+    for doc_id in merge(*postings_lists):
+        if not result or result[-1] != doc_id:
+            result.append(doc_id)
+
+    return result
@@ -0,0 +1,68 @@
+"""Sorted runs of posting lists on hard drive
+
+Run is a file with (word, posting list) pairs sorted by utf-8 encoded word.
+Every pair is stored as varint key length, key, varint posting list length
+in bytes and posting list compressed by posting_codec.
+Runs are used to build inverted index which does not fit in memory.
+"""
+from heapq import merge
+from itertools import groupby
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from posting_codec import decode_postings, encode_postings, encode_varint
+
+
+RUN_BUFFER_SIZE = 1 << 20
+
+
+def write_run(word_to_doc_ids: Dict[str, Iterable[int]], filepath: str):
+    """Write posting lists to a run file in sorted order of words"""
+    items = sorted((word.encode(), doc_ids) for word, doc_ids in word_to_doc_ids.items())
+    with open(filepath, "wb", buffering=RUN_BUFFER_SIZE) as file:
+        for key, doc_ids in items:
+            record = bytearray()
+            postings = encode_postings(doc_ids)
+            encode_varint(len(key), record)
+            record += key
+            encode_varint(len(postings), record)
+            record += postings
+            file.write(record)
+
+
+def _read_varint(file):
+    value = 0
+    shift = 0
+    while True:
+        byte = file.read(1)
+        if not byte:
+            return None
+        value |= (byte[0] & 0x7F) << shift
+        if byte[0] < 0x80:
+            return value
+        shift += 7
+
+
+def read_run(filepath: str) -> Iterator[Tuple[bytes, List[int]]]:
+    """Iterate (encoded word, sorted document ids) pairs of a run file"""
+    with open(filepath, "rb", buffering=RUN_BUFFER_SIZE) as file:
+        while True:
+            len_key = _read_varint(file)
+            if len_key is None:
+                return
+            key = file.read(len_key)
+            postings = file.read(_read_varint(file))
+            yield key, decode_postings(postings)
+
+
+def merge_runs(filepaths: List[str]) -> Iterator[Tuple[bytes, List[int]]]:
+    """K-way merge of run files into (encoded word, sorted document ids) pairs
+
+    Only the current pair of every run is kept in memory.
+    """
+    items = merge(*(read_run(filepath) for filepath in filepaths), key=lambda item: item[0])
+    for key, group in groupby(items, key=lambda item: item[0]):
+        doc_ids = []
+        for doc_id in merge(*(postings for _, postings in group)):
+            if not doc_ids or doc_ids[-1] != doc_id:
+                doc_ids.append(doc_id)
+        yield key, doc_ids
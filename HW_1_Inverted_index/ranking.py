@@ -0,0 +1,187 @@
+"""Ranked retrieval with BM25
+
+Bm25Statistics keeps term frequencies aligned with sorted posting lists and
+document lengths. top_k_wand returns top documents by BM25 with WAND dynamic
+pruning: documents whose upper bound of score can not beat the current top-k
+are skipped without scoring.
+"""
+from array import array
+from collections import Counter, defaultdict
+from heapq import heappush, heapreplace
+from math import log
+import struct
+from typing import Dict, List, Sequence, Tuple
+
+from posting_codec import decode_postings, decode_varint, encode_postings, encode_varint
+from posting_list import gallop
+from tokenizer import Tokenizer
+
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+class Bm25Statistics:
+    """Term frequencies and document lengths for BM25
+
+    term_frequencies[word][i] is frequency of word in the i-th document
+    of sorted posting list of word.
+    """
+    def __init__(self, doc_lengths: Dict[int, int], term_frequencies: Dict[str, Sequence[int]]):
+        self.doc_lengths = doc_lengths
+        self.term_frequencies = term_frequencies
+        self.num_documents = len(doc_lengths)
+        self.avg_doc_length = sum(doc_lengths.values()) / max(self.num_documents, 1)
+        self.min_doc_length = min(doc_lengths.values(), default=0)
+        self._max_frequencies = {}
+
+    def __eq__(self, other):
+        return (
+            self.doc_lengths == other.doc_lengths
+            and self.term_frequencies == other.term_frequencies
+        )
+
+    @classmethod
+    def from_documents(cls, documents: List[str], tokenizer: Tokenizer = None):
+        """Count term frequencies and lengths of documents"""
+        tokenizer = tokenizer or Tokenizer()
+        doc_lengths = {}
+        frequencies = defaultdict(dict)
+        for document in documents:
+            document_id, data = tokenizer.split_document(document)
+            document_id = int(document_id)
+            doc_lengths[document_id] = len(data)
+            for word, count in Counter(data).items():
+                frequencies[word][document_id] = count
+
+        term_frequencies = {
+            word: array("I", (doc_frequencies[doc_id] for doc_id in sorted(doc_frequencies)))
+            for word, doc_frequencies in frequencies.items()
+        }
+        return cls(doc_lengths, term_frequencies)
+
+    def idf(self, document_frequency: int) -> float:
+        return log(1 + (self.num_documents - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def term_score(self, idf: float, frequency: int, doc_length: int,
+                   k1: float = BM25_K1, b: float = BM25_B) -> float:
+        norm = k1 * (1 - b + b * doc_length / self.avg_doc_length)
+        return idf * frequency * (k1 + 1) / (frequency + norm)
+
+    def upper_bound(self, word: str, idf: float) -> float:
+        """Upper bound of word score: maximal frequency in the shortest document"""
+        if word not in self._max_frequencies:
+            self._max_frequencies[word] = max(self.term_frequencies[word], default=0)
+        return self.term_score(idf, self._max_frequencies[word], self.min_doc_length)
+
+    def dump(self, filepath: str):
+        """Dump statistics into binary file
+
+        File layout: number of documents (big-endian uint32), byte length and
+        sorted document ids compressed by posting_codec, varint length of every
+        document, number of terms (big-endian uint32) and for every term
+        varint key length, utf-8 key, varint number and varint frequencies.
+        """
+        doc_ids = sorted(self.doc_lengths)
+        content = bytearray(struct.pack(">1I", len(doc_ids)))
+        postings = encode_postings(doc_ids)
+        encode_varint(len(postings), content)
+        content += postings
+        for doc_id in doc_ids:
+            encode_varint(self.doc_lengths[doc_id], content)
+
+        content += struct.pack(">1I", len(self.term_frequencies))
+        for word, frequencies in self.term_frequencies.items():
+            key = word.encode()
+            encode_varint(len(key), content)
+            content += key
+            encode_varint(len(frequencies), content)
+            for frequency in frequencies:
+                encode_varint(frequency, content)
+
+        with open(filepath, "wb") as file:
+            file.write(content)
+
+    @classmethod
+    def load(cls, filepath: str):
+        """Load statistics from binary file"""
+        with open(filepath, "rb") as file:
+            content = file.read()
+
+        num_docs = struct.unpack_from(">1I", content)[0]
+        len_postings, position = decode_varint(content, 4)
+        doc_ids = decode_postings(content, position, position + len_postings)
+        position += len_postings
+        doc_lengths = {}
+        for doc_id in doc_ids[:num_docs]:
+            doc_lengths[doc_id], position = decode_varint(content, position)
+
+        num_terms = struct.unpack_from(">1I", content, position)[0]
+        position += 4
+        term_frequencies = {}
+        for _ in range(num_terms):
+            len_key, position = decode_varint(content, position)
+            word = content[position:position + len_key].decode()
+            position += len_key
+            num_frequencies, position = decode_varint(content, position)
+            frequencies = array("I")
+            for _ in range(num_frequencies):
+                frequency, position = decode_varint(content, position)
+                frequencies.append(frequency)
+            term_frequencies[word] = frequencies
+
+        return cls(doc_lengths, term_frequencies)
+
+
+def top_k_wand(
+        terms: List[Tuple[Sequence[int], Sequence[int], float, float]],
+        statistics: Bm25Statistics, top_k: int,
+) -> List[Tuple[int, float]]:
+    """Return top_k (document id, BM25 score) pairs with WAND pruning
+
+    terms: (sorted document ids, frequencies, idf, upper bound of term score) for every query term.
+    Result is sorted by score descending, ties by document id.
+    """
+    if top_k <= 0:
+        return []
+
+    cursors = [[postings, frequencies, idf, upper_bound, 0]
+               for postings, frequencies, idf, upper_bound in terms if len(postings)]
+    top = []
+    while cursors:
+        cursors.sort(key=lambda cursor: cursor[0][cursor[4]])
+        threshold = top[0][0] if len(top) == top_k else 0.0
+        upper_bound = 0.0
+        pivot = None
+        for index, cursor in enumerate(cursors):
+            upper_bound += cursor[3]
+            if upper_bound >= threshold:
+                pivot = index
+                break
+        if pivot is None:
+            break
+
+        # int() keeps -pivot_doc exact for numpy unsigned document ids
+        pivot_doc = int(cursors[pivot][0][cursors[pivot][4]])
+        if cursors[0][0][cursors[0][4]] == pivot_doc:
+            score = 0.0
+            for cursor in cursors:
+                postings, frequencies, idf, _, position = cursor
+                if postings[position] != pivot_doc:
+                    break
+                score += statistics.term_score(
+                    idf, frequencies[position], statistics.doc_lengths[pivot_doc]
+                )
+                cursor[4] += 1
+
+            if len(top) < top_k:
+                heappush(top, (score, -pivot_doc))
+            elif (score, -pivot_doc) > top[0]:
+                heapreplace(top, (score, -pivot_doc))
+        else:
+            for cursor in cursors[:pivot]:
+                cursor[4] = gallop(cursor[0], pivot_doc, cursor[4])
+
+        cursors = [cursor for cursor in cursors if cursor[4] < len(cursor[0])]
+
+    return [(-neg_doc_id, score) for score, neg_doc_id in sorted(top, reverse=True)]
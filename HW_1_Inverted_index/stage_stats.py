@@ -0,0 +1,84 @@
+"""Timing and memory statistics of stages
+
+Every stage records wall time, CPU time of the process and of finished
+child processes (workers of parallel build), peak resident set size of
+the process after the stage and item counts reported by the stage.
+Peak RSS is a high-water mark of the whole process, it never decreases.
+"""
+from contextlib import contextmanager
+import resource
+import sys
+from time import perf_counter, process_time
+from typing import Dict
+
+
+def peak_rss_kb() -> int:
+    """Peak resident set size of the process in kilobytes
+
+    VmHWM of /proc/self/status is used on Linux: unlike ru_maxrss it is not
+    inherited from the parent by a spawned process.
+    """
+    try:
+        with open("/proc/self/status") as status_file:
+            for line in status_file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss // 1024 if sys.platform == "darwin" else peak_rss
+
+
+def children_cpu_seconds() -> float:
+    """CPU time of finished child processes"""
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class StageStats:
+    """Statistics of stages, nothing is recorded if it is disabled
+
+    main methods:
+    - stage(name: str): context manager, yields dict where stage puts its item counts
+    - to_dict() -> Dict: recorded stages and totals
+    """
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.stages = []
+        self._start_wall = perf_counter()
+        self._start_cpu = process_time()
+        self._start_children_cpu = children_cpu_seconds()
+
+    @contextmanager
+    def stage(self, name: str):
+        counts = {}
+        if not self.enabled:
+            yield counts
+            return
+
+        start_wall = perf_counter()
+        start_cpu = process_time()
+        start_children_cpu = children_cpu_seconds()
+        try:
+            yield counts
+        finally:
+            self.stages.append({
+                "stage": name,
+                "wall_seconds": perf_counter() - start_wall,
+                "cpu_seconds": process_time() - start_cpu,
+                "children_cpu_seconds": children_cpu_seconds() - start_children_cpu,
+                "peak_rss_kb": peak_rss_kb(),
+                **counts,
+            })
+
+    def to_dict(self) -> Dict:
+        return {
+            "stages": self.stages,
+            "total": {
+                "wall_seconds": perf_counter() - self._start_wall,
+                "cpu_seconds": process_time() - self._start_cpu,
+                "children_cpu_seconds": children_cpu_seconds() - self._start_children_cpu,
+                "peak_rss_kb": peak_rss_kb(),
+            },
+        }
@@ -1,8 +1,198 @@
-import struct
+"""Storage policies of inverted index
+
+Every policy is registered with a name and a codec id. Binary policies write
+a small self-describing header before their payload:
+magic b"IIDX", format version, codec id, number of terms, payload length
+and CRC32 of payload (big-endian, INDEX_HEADER). The header is enough to
+detect the policy of a file and to reject a truncated file without reading it.
+Files without header are json (starts with "{") or legacy array format.
+"""
+from array import array
+from collections import namedtuple
+from collections.abc import Mapping
 import json
+import mmap
+import os
+import struct
+import zlib
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only numpy_storage_policy needs it
+    np = None
+
+from posting_codec import count_postings, decode_postings, decode_varint, encode_postings, encode_varint
+from term_dictionary import FrontCodedTermDictionary
+
+
+INDEX_FILE_MAGIC = b"IIDX"
+# version 2: term table of mmap_storage_policy stores document frequencies
+INDEX_FORMAT_VERSION = 2
+INDEX_HEADER = struct.Struct(">4sHHQQI")
+CHECKSUM_CHUNK_SIZE = 1 << 20
+# array_storage_policy packs key length as 1 byte and numbers as signed 2 bytes
+ARRAY_MAX_KEY_LENGTH = 255
+ARRAY_MIN_VALUE = -(1 << 15)
+ARRAY_MAX_VALUE = (1 << 15) - 1
+
+IndexHeader = namedtuple("IndexHeader", "version codec_id num_terms payload_length checksum")
+
+STORAGE_POLICIES = {}
+
+
+class IndexFormatError(ValueError):
+    """Index file is truncated, corrupted or written by another policy"""
+
+
+def register_storage_policy(name: str, codec_id: int):
+    """Class decorator to register storage policy under name and codec id"""
+    def register(policy):
+        policy.name = name
+        policy.codec_id = codec_id
+        STORAGE_POLICIES[name] = policy
+        return policy
+
+    return register
+
+
+def get_storage_policy(name: str):
+    """Return registered storage policy by name"""
+    if name not in STORAGE_POLICIES:
+        raise ValueError(f"unknown storage policy {name}, choose one of {list(STORAGE_POLICIES)}")
+
+    return STORAGE_POLICIES[name]
+
+
+def read_index_header(filepath: str):
+    """Read header of index file, return None for a file without header"""
+    with open(filepath, "rb") as file:
+        content = file.read(INDEX_HEADER.size)
+
+    if not content.startswith(INDEX_FILE_MAGIC):
+        return None
+    if len(content) < INDEX_HEADER.size:
+        raise IndexFormatError(f"{filepath}: truncated header")
+
+    return IndexHeader(*INDEX_HEADER.unpack(content)[1:])
+
+
+def check_index_header(filepath: str, codec_id: int = None) -> IndexHeader:
+    """Read and validate header: version, codec and size of file, but not checksum"""
+    header = read_index_header(filepath)
+    if header is None:
+        raise IndexFormatError(f"{filepath}: no index header")
+    if header.version > INDEX_FORMAT_VERSION:
+        raise IndexFormatError(f"{filepath}: unsupported format version {header.version}")
+    if codec_id is not None and header.codec_id != codec_id:
+        raise IndexFormatError(f"{filepath}: codec {header.codec_id} is stored, expected {codec_id}")
+    if os.path.getsize(filepath) != INDEX_HEADER.size + header.payload_length:
+        raise IndexFormatError(f"{filepath}: file is truncated or has extra data")
+
+    return header
+
+
+def verify_index_file(filepath: str) -> IndexHeader:
+    """Validate header and checksum of payload reading the file by chunks"""
+    header = check_index_header(filepath)
+    checksum = 0
+    with open(filepath, "rb") as file:
+        file.seek(INDEX_HEADER.size)
+        while True:
+            chunk = file.read(CHECKSUM_CHUNK_SIZE)
+            if not chunk:
+                break
+            checksum = zlib.crc32(chunk, checksum)
+
+    if checksum != header.checksum:
+        raise IndexFormatError(f"{filepath}: checksum mismatch")
+
+    return header
+
+
+def read_index_payload(filepath: str, codec_id: int):
+    """Read validated payload of index file, return (header, payload)"""
+    header = check_index_header(filepath, codec_id)
+    with open(filepath, "rb") as file:
+        file.seek(INDEX_HEADER.size)
+        payload = file.read()
+
+    if zlib.crc32(payload) != header.checksum:
+        raise IndexFormatError(f"{filepath}: checksum mismatch")
+
+    return header, payload
+
+
+def detect_storage_policy(filepath: str) -> str:
+    """Return name of storage policy of index file"""
+    header = read_index_header(filepath)
+    if header is not None:
+        for name, policy in STORAGE_POLICIES.items():
+            if policy.codec_id == header.codec_id:
+                return name
+        raise IndexFormatError(f"{filepath}: unknown codec {header.codec_id}")
+
+    with open(filepath, "rb") as file:
+        if file.read(64).lstrip()[:1] == b"{":
+            return "json_storage_policy"
+
+    return "array_storage_policy"
+
+
+class IndexFileWriter:
+    """Context manager to write index file with header
+
+    Space for header is reserved on enter, payload is written to .file,
+    header with checksum of payload is written on exit. Set .num_terms before exit.
+    File is written to a temporary path and replaces filepath only on success,
+    so a failed dump leaves neither a broken index nor a half written one.
+    """
+    payload_offset = INDEX_HEADER.size
+
+    def __init__(self, filepath: str, codec_id: int):
+        self.filepath = os.fspath(filepath)
+        self.codec_id = codec_id
+        self.num_terms = 0
+        self.file = None
+
+    @property
+    def temporary_filepath(self) -> str:
+        return f"{self.filepath}.tmp"
+
+    def __enter__(self):
+        self.file = open(self.temporary_filepath, "wb+")
+        self.file.write(bytes(INDEX_HEADER.size))
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        completed = False
+        try:
+            if exc_type is None:
+                payload_length = self.file.seek(0, os.SEEK_END) - INDEX_HEADER.size
+                self.file.seek(INDEX_HEADER.size)
+                checksum = 0
+                while True:
+                    chunk = self.file.read(CHECKSUM_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    checksum = zlib.crc32(chunk, checksum)
+                self.file.seek(0)
+                self.file.write(INDEX_HEADER.pack(
+                    INDEX_FILE_MAGIC, INDEX_FORMAT_VERSION, self.codec_id,
+                    self.num_terms, payload_length, checksum,
+                ))
+                completed = True
+        finally:
+            self.file.close()
+            if completed:
+                os.replace(self.temporary_filepath, self.filepath)
+            else:
+                os.remove(self.temporary_filepath)
 
 
 class StoragePolicy:
+    name = None
+    codec_id = None
+
     @staticmethod
     def dump(word_to_docs_mapping, filepath: str):
         pass
@@ -12,7 +202,9 @@ class StoragePolicy:
         pass
 
 
+@register_storage_policy("json_storage_policy", codec_id=0)
 class JsonStoragePolicy(StoragePolicy):
+    """Text format without header, json itself fails on a truncated file"""
     @staticmethod
     def dump(word_to_docs_mapping, filepath: str):
         with open(filepath, 'w') as outfile:
@@ -26,11 +218,13 @@ class JsonStoragePolicy(StoragePolicy):
         return data
 
 
+@register_storage_policy("array_storage_policy", codec_id=1)
 class ArrayStoragePolicy(StoragePolicy):
     @staticmethod
     def dump(word_to_docs_mapping, filepath: str):
         keys = list(word_to_docs_mapping.keys())
         values = list(word_to_docs_mapping.values())
+        ArrayStoragePolicy._check_limits(keys, values)
         format_str = ">1i"
         item_to_pack = [len(keys)]
         for i in range(len(keys)):
@@ -50,20 +244,528 @@ class ArrayStoragePolicy(StoragePolicy):
                 item_to_pack.append(int(val))
 
         pack_pbj = struct.pack(format_str, *item_to_pack)
-        with open(filepath, "wb") as file:
-            file.write(pack_pbj)
+        with IndexFileWriter(filepath, ArrayStoragePolicy.codec_id) as writer:
+            writer.file.write(pack_pbj)
+            writer.num_terms = len(keys)
+
+    @staticmethod
+    def _check_limits(keys, values):
+        """Raise ValueError for data which does not fit into 1 byte key lengths and 2 byte numbers"""
+        for key, doc_ids in zip(keys, values):
+            if len(key.encode()) > ARRAY_MAX_KEY_LENGTH:
+                raise ValueError(
+                    f"array_storage_policy can not store word {key!r} longer than "
+                    f"{ARRAY_MAX_KEY_LENGTH} bytes, use compressed_storage_policy"
+                )
+            if len(doc_ids) > ARRAY_MAX_VALUE:
+                raise ValueError(
+                    f"array_storage_policy can not store more than {ARRAY_MAX_VALUE} documents "
+                    f"of word {key!r}, use compressed_storage_policy"
+                )
+            for doc_id in doc_ids:
+                if not ARRAY_MIN_VALUE <= int(doc_id) <= ARRAY_MAX_VALUE:
+                    raise ValueError(
+                        f"array_storage_policy can not store document id {doc_id} out of range "
+                        f"[{ARRAY_MIN_VALUE}, {ARRAY_MAX_VALUE}], use compressed_storage_policy"
+                    )
 
     @staticmethod
     def load(filepath: str):
+        if read_index_header(filepath) is None:
+            # legacy file without header
+            with open(filepath, "rb") as file:
+                return ArrayStoragePolicy._parse(file.read())
+
+        _, payload = read_index_payload(filepath, ArrayStoragePolicy.codec_id)
+        return ArrayStoragePolicy._parse(payload)
+
+    @staticmethod
+    def _parse(content: bytes):
         keys = []
         values = []
-        with open(filepath, "rb") as file:
-            num_items = struct.unpack(">1i", file.read(4))[0]
-            for _ in range(num_items):
-                len_key = struct.unpack(">1B", file.read(1))[0]
-                keys.append(struct.unpack(f">{len_key}s", file.read(len_key))[0].decode())
-                num_vals = struct.unpack(">1h", file.read(2))[0]
-                vals = list(struct.unpack(f">{num_vals}h", file.read(num_vals * 2)))
-                values.append(list(map(str, vals)))
+        num_items = struct.unpack_from(">1i", content)[0]
+        position = 4
+        for _ in range(num_items):
+            len_key = struct.unpack_from(">1B", content, position)[0]
+            position += 1
+            keys.append(struct.unpack_from(f">{len_key}s", content, position)[0].decode())
+            position += len_key
+            num_vals = struct.unpack_from(">1h", content, position)[0]
+            position += 2
+            vals = list(struct.unpack_from(f">{num_vals}h", content, position))
+            position += num_vals * 2
+            values.append(list(map(str, vals)))
 
         return dict(zip(keys, values))
+
+
+@register_storage_policy("compressed_storage_policy", codec_id=2)
+class CompressedStoragePolicy(StoragePolicy):
+    """Binary format with posting lists compressed by posting_codec
+
+    Payload: for every term varint key length, utf-8 key,
+    varint posting list length in bytes and posting list.
+    """
+    @staticmethod
+    def dump(word_to_docs_mapping, filepath: str):
+        content = bytearray()
+        for word, docs in word_to_docs_mapping.items():
+            CompressedStoragePolicy._append_item(content, word.encode(), docs)
+
+        with IndexFileWriter(filepath, CompressedStoragePolicy.codec_id) as writer:
+            writer.file.write(content)
+            writer.num_terms = len(word_to_docs_mapping)
+
+    @staticmethod
+    def _append_item(content: bytearray, key: bytes, docs):
+        postings = encode_postings(docs)
+        encode_varint(len(key), content)
+        content += key
+        encode_varint(len(postings), content)
+        content += postings
+
+    @staticmethod
+    def dump_sorted_items(items, filepath: str):
+        """Dump (encoded word, documents) pairs as soon as they come, items can be a generator"""
+        with IndexFileWriter(filepath, CompressedStoragePolicy.codec_id) as writer:
+            for key, docs in items:
+                content = bytearray()
+                CompressedStoragePolicy._append_item(content, key, docs)
+                writer.file.write(content)
+                writer.num_terms += 1
+
+    @staticmethod
+    def load(filepath: str):
+        header, payload = read_index_payload(filepath, CompressedStoragePolicy.codec_id)
+        return PackedPostingsDict(sorted(CompressedStoragePolicy._iter_items(payload, header.num_terms)))
+
+    @staticmethod
+    def _iter_items(content: bytes, num_items: int):
+        position = 0
+        for _ in range(num_items):
+            len_key, position = decode_varint(content, position)
+            key = content[position:position + len_key]
+            position += len_key
+            len_postings, position = decode_varint(content, position)
+            yield key, content[position:position + len_postings]
+            position += len_postings
+
+
+class PackedPostingsDict(Mapping):
+    """Read-only word -> documents mapping packed into a few flat buffers
+
+    Words are kept in FrontCodedTermDictionary, posting lists compressed
+    by posting_codec are concatenated in order of term ids, so there are
+    no per-word Python objects until a word is requested.
+    """
+    def __init__(self, encoded_items):
+        """encoded_items: (encoded word, compressed posting list) pairs sorted by encoded word"""
+        keys = []
+        postings = bytearray()
+        self._postings_offsets = array("Q")
+        for key, encoded_postings in encoded_items:
+            keys.append(key)
+            self._postings_offsets.append(len(postings))
+            postings += encoded_postings
+        self._postings_offsets.append(len(postings))
+        self._postings = bytes(postings)
+        self._terms = FrontCodedTermDictionary(keys)
+
+    @classmethod
+    def from_dict(cls, word_to_docs_mapping):
+        return cls(sorted(
+            (word.encode(), encode_postings(docs)) for word, docs in word_to_docs_mapping.items()
+        ))
+
+    @property
+    def nbytes(self) -> int:
+        """Size of packed data in bytes"""
+        return (
+            self._terms.nbytes + len(self._postings)
+            + self._postings_offsets.itemsize * len(self._postings_offsets)
+        )
+
+    def _decode_postings(self, term_id: int) -> list:
+        return decode_postings(
+            self._postings, self._postings_offsets[term_id], self._postings_offsets[term_id + 1]
+        )
+
+    def __getitem__(self, word: str) -> list:
+        term_id = self._terms.find(word)
+        if term_id < 0:
+            raise KeyError(word)
+
+        return list(map(str, self._decode_postings(term_id)))
+
+    def get_int_postings(self, word: str):
+        """Return sorted array of integer document ids for word or None"""
+        term_id = self._terms.find(word)
+        if term_id < 0:
+            return None
+
+        return array("q", self._decode_postings(term_id))
+
+    def document_frequency(self, word: str) -> int:
+        """Return number of documents with word without decoding posting list"""
+        term_id = self._terms.find(word)
+        if term_id < 0:
+            return 0
+
+        return count_postings(
+            self._postings, self._postings_offsets[term_id], self._postings_offsets[term_id + 1]
+        )
+
+    def __contains__(self, word) -> bool:
+        return isinstance(word, str) and self._terms.find(word) >= 0
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def __iter__(self):
+        return iter(self._terms)
+
+    def keys_with_prefix(self, prefix: str):
+        """Iterate words which start with prefix in sorted order"""
+        return (word for _, word in self._terms.prefix(prefix))
+
+    def keys_in_range(self, low: str, high: str):
+        """Iterate words in range [low, high) in sorted order"""
+        return (word for _, word in self._terms.range(low, high))
+
+
+class LazyPostingsDict(Mapping):
+    """Read-only word -> documents mapping on top of a memory-mapped index file
+
+    Only the header is read on creation, the term table is binary searched
+    in place and a posting list is decoded when a word is requested.
+    term_entry: struct of term table entry, files of version 1 have no document frequencies.
+    """
+    def __init__(self, buffer, num_terms: int, term_table_offset: int, term_entry: struct.Struct = None):
+        self._buffer = buffer
+        self._num_terms = num_terms
+        self._term_table_offset = term_table_offset
+        self._term_entry = term_entry or MmapStoragePolicy.TERM_ENTRY
+
+    def _entry(self, index: int):
+        return self._term_entry.unpack_from(
+            self._buffer, self._term_table_offset + index * self._term_entry.size
+        )
+
+    def _key(self, index: int) -> bytes:
+        key_start = self._entry(index)[0]
+        key_end = self._entry(index + 1)[0]
+        return self._buffer[key_start:key_end]
+
+    def _lower_bound(self, key: bytes) -> int:
+        """Return position of the first key >= key in the term table"""
+        low, high = 0, self._num_terms
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def _find(self, word: str) -> int:
+        """Return position of word in the term table or -1"""
+        key = word.encode()
+        index = self._lower_bound(key)
+        if index < self._num_terms and self._key(index) == key:
+            return index
+
+        return -1
+
+    def keys_with_prefix(self, prefix: str):
+        """Iterate words which start with prefix in sorted order"""
+        key = prefix.encode()
+        for index in range(self._lower_bound(key), self._num_terms):
+            word_key = self._key(index)
+            if not word_key.startswith(key):
+                return
+            yield word_key.decode()
+
+    def keys_in_range(self, low: str, high: str):
+        """Iterate words in range [low, high) in sorted order"""
+        high_key = high.encode()
+        for index in range(self._lower_bound(low.encode()), self._num_terms):
+            word_key = self._key(index)
+            if word_key >= high_key:
+                return
+            yield word_key.decode()
+
+    def _decode_postings(self, index: int) -> list:
+        postings_start = self._entry(index)[1]
+        postings_end = self._entry(index + 1)[1]
+        return decode_postings(self._buffer, postings_start, postings_end)
+
+    def __getitem__(self, word: str) -> list:
+        index = self._find(word)
+        if index < 0:
+            raise KeyError(word)
+
+        return list(map(str, self._decode_postings(index)))
+
+    def get_int_postings(self, word: str):
+        """Return sorted array of integer document ids for word or None"""
+        index = self._find(word)
+        if index < 0:
+            return None
+
+        return array("q", self._decode_postings(index))
+
+    def document_frequency(self, word: str) -> int:
+        """Return number of documents with word from the term table"""
+        index = self._find(word)
+        if index < 0:
+            return 0
+
+        entry = self._entry(index)
+        if len(entry) > 2:
+            return entry[2]
+        return count_postings(self._buffer, entry[1], self._entry(index + 1)[1])
+
+    def __contains__(self, word) -> bool:
+        return isinstance(word, str) and self._find(word) >= 0
+
+    def __len__(self) -> int:
+        return self._num_terms
+
+    def __iter__(self):
+        for index in range(self._num_terms):
+            yield self._key(index).decode()
+
+    def close(self):
+        self._buffer.close()
+
+
+@register_storage_policy("mmap_storage_policy", codec_id=3)
+class MmapStoragePolicy(StoragePolicy):
+    """Binary format with a sorted term table which is loaded lazily
+
+    Payload (big-endian), offsets are from the start of file:
+    - offset of term table
+    - posting lists: sorted document ids of every term compressed by posting_codec
+    - keys: utf-8 encoded terms one after another in sorted order
+    - term table: (key offset, posting list offset, document frequency) for every term
+      and one closing entry with the end of keys and posting lists
+    Load checks only the header, checksum is checked by verify_index_file.
+    """
+    HEADER = struct.Struct(">Q")
+    TERM_ENTRY = struct.Struct(">QQI")
+    TERM_ENTRY_V1 = struct.Struct(">QQ")
+
+    @staticmethod
+    def dump(word_to_docs_mapping, filepath: str):
+        items = sorted(
+            ((word.encode(), docs) for word, docs in word_to_docs_mapping.items()),
+            key=lambda item: item[0],
+        )
+        MmapStoragePolicy.dump_sorted_items(items, filepath)
+
+    @staticmethod
+    def dump_sorted_items(items, filepath: str):
+        """Dump (encoded word, documents) pairs which are sorted by word
+
+        Posting lists are written as soon as they come, so items can be a generator.
+        """
+        keys = []
+        postings_offsets = []
+        document_frequencies = []
+        with IndexFileWriter(filepath, MmapStoragePolicy.codec_id) as writer:
+            file = writer.file
+            file.write(MmapStoragePolicy.HEADER.pack(0))
+            for key, docs in items:
+                keys.append(key)
+                postings_offsets.append(file.tell())
+                postings = encode_postings(docs)
+                document_frequencies.append(count_postings(postings))
+                file.write(postings)
+
+            postings_end = file.tell()
+            keys_offsets = []
+            for key in keys:
+                keys_offsets.append(file.tell())
+                file.write(key)
+
+            keys_offsets.append(file.tell())
+            postings_offsets.append(postings_end)
+            document_frequencies.append(0)
+            term_table_offset = file.tell()
+            for entry in zip(keys_offsets, postings_offsets, document_frequencies):
+                file.write(MmapStoragePolicy.TERM_ENTRY.pack(*entry))
+
+            file.seek(writer.payload_offset)
+            file.write(MmapStoragePolicy.HEADER.pack(term_table_offset))
+            writer.num_terms = len(keys)
+
+    @staticmethod
+    def load(filepath: str):
+        header = check_index_header(filepath, MmapStoragePolicy.codec_id)
+        with open(filepath, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        term_table_offset = MmapStoragePolicy.HEADER.unpack_from(buffer, INDEX_HEADER.size)[0]
+        term_entry = MmapStoragePolicy.TERM_ENTRY if header.version >= 2 else MmapStoragePolicy.TERM_ENTRY_V1
+        return LazyPostingsDict(buffer, header.num_terms, term_table_offset, term_entry)
+
+
+class NumpyPostingsDict(Mapping):
+    """Read-only word -> documents mapping on top of numpy arrays
+
+    Posting lists of all words are one contiguous uint32 array sliced by
+    postings offsets, sorted keys are one uint8 array sliced by key offsets.
+    Arrays are usually memory-mapped, get_int_postings returns a view without copying.
+    """
+    def __init__(self, postings_offsets, postings, keys_offsets, keys):
+        self._postings_offsets = postings_offsets
+        self._postings = postings
+        self._keys_offsets = keys_offsets
+        self._keys = keys
+
+    @property
+    def nbytes(self) -> int:
+        """Size of arrays in bytes"""
+        return sum(values.nbytes for values in (
+            self._postings_offsets, self._postings, self._keys_offsets, self._keys,
+        ))
+
+    def _key(self, index: int) -> bytes:
+        return self._keys[self._keys_offsets[index]:self._keys_offsets[index + 1]].tobytes()
+
+    def _lower_bound(self, key: bytes) -> int:
+        """Return position of the first key >= key"""
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        return low
+
+    def _find(self, word: str) -> int:
+        """Return position of word or -1"""
+        key = word.encode()
+        index = self._lower_bound(key)
+        if index < len(self) and self._key(index) == key:
+            return index
+
+        return -1
+
+    def keys_with_prefix(self, prefix: str):
+        """Iterate words which start with prefix in sorted order"""
+        key = prefix.encode()
+        for index in range(self._lower_bound(key), len(self)):
+            word_key = self._key(index)
+            if not word_key.startswith(key):
+                return
+            yield word_key.decode()
+
+    def keys_in_range(self, low: str, high: str):
+        """Iterate words in range [low, high) in sorted order"""
+        high_key = high.encode()
+        for index in range(self._lower_bound(low.encode()), len(self)):
+            word_key = self._key(index)
+            if word_key >= high_key:
+                return
+            yield word_key.decode()
+
+    def _slice_postings(self, index: int):
+        return self._postings[self._postings_offsets[index]:self._postings_offsets[index + 1]]
+
+    def __getitem__(self, word: str) -> list:
+        index = self._find(word)
+        if index < 0:
+            raise KeyError(word)
+
+        return list(map(str, self._slice_postings(index).tolist()))
+
+    def get_int_postings(self, word: str):
+        """Return sorted uint32 array of document ids for word or None"""
+        index = self._find(word)
+        if index < 0:
+            return None
+
+        return self._slice_postings(index)
+
+    def document_frequency(self, word: str) -> int:
+        """Return number of documents with word from postings offsets"""
+        index = self._find(word)
+        if index < 0:
+            return 0
+
+        return int(self._postings_offsets[index + 1] - self._postings_offsets[index])
+
+    def __contains__(self, word) -> bool:
+        return isinstance(word, str) and self._find(word) >= 0
+
+    def __len__(self) -> int:
+        return len(self._keys_offsets) - 1
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self._key(index).decode()
+
+
+@register_storage_policy("numpy_storage_policy", codec_id=4)
+class NumpyStoragePolicy(StoragePolicy):
+    """Binary format of numpy arrays which are memory-mapped on load, requires numpy
+
+    Payload is four arrays written by np.save one after another:
+    postings offsets (uint64), posting lists (uint32 document ids),
+    keys offsets (uint64) and utf-8 encoded sorted keys (uint8).
+    Document ids should fit in uint32.
+    """
+    POSTINGS_DTYPE = "uint32"
+
+    @staticmethod
+    def _check_numpy():
+        if np is None:
+            raise ImportError("numpy_storage_policy requires numpy")
+
+    @staticmethod
+    def dump(word_to_docs_mapping, filepath: str):
+        NumpyStoragePolicy._check_numpy()
+        items = sorted((word.encode(), docs) for word, docs in word_to_docs_mapping.items())
+        postings_lists = [np.unique(np.array(list(map(int, docs)), dtype=np.int64)) for _, docs in items]
+        for postings in postings_lists:
+            if len(postings) and (postings[0] < 0 or postings[-1] > np.iinfo(np.uint32).max):
+                raise ValueError("numpy_storage_policy supports only document ids in range of uint32")
+
+        keys = [key for key, _ in items]
+        arrays = (
+            np.cumsum([0] + list(map(len, postings_lists)), dtype=np.uint64),
+            np.concatenate(postings_lists or [np.empty(0, dtype=np.int64)]).astype(NumpyStoragePolicy.POSTINGS_DTYPE),
+            np.cumsum([0] + list(map(len, keys)), dtype=np.uint64),
+            np.frombuffer(b"".join(keys), dtype=np.uint8),
+        )
+        with IndexFileWriter(filepath, NumpyStoragePolicy.codec_id) as writer:
+            for values in arrays:
+                np.save(writer.file, values)
+            writer.num_terms = len(keys)
+
+    @staticmethod
+    def load(filepath: str):
+        NumpyStoragePolicy._check_numpy()
+        filepath = os.fspath(filepath)
+        check_index_header(filepath, NumpyStoragePolicy.codec_id)
+        arrays = []
+        with open(filepath, "rb") as file:
+            file.seek(INDEX_HEADER.size)
+            for _ in range(4):
+                version = np.lib.format.read_magic(file)
+                if version == (1, 0):
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(file)
+                else:
+                    shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(file)
+                offset = file.tell()
+                if shape[0]:
+                    arrays.append(np.memmap(filepath, dtype=dtype, mode="r", offset=offset, shape=shape))
+                else:
+                    arrays.append(np.empty(shape, dtype=dtype))
+                file.seek(offset + shape[0] * dtype.itemsize)
+
+        return NumpyPostingsDict(*arrays)
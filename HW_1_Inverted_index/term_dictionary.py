@@ -0,0 +1,134 @@
+"""Compact sorted term dictionary
+
+Terms are sorted by utf-8 bytes and front coded in blocks of BLOCK_SIZE terms:
+the first term of a block is stored in full (varint length and bytes), every
+next term as varint length of prefix shared with the previous term, varint
+length of suffix and suffix. Term id is the position of term in sorted order.
+The whole dictionary is one bytes object and one array of block offsets.
+"""
+from array import array
+from typing import Iterable, Iterator, Tuple
+
+from posting_codec import decode_varint, encode_varint
+
+
+BLOCK_SIZE = 16
+
+
+class FrontCodedTermDictionary:
+    """Front coded sorted array of terms
+
+    main methods:
+    - find(word: str) -> int: term id or -1
+    - prefix(prefix: str) -> Iterator[Tuple[int, str]]: terms starting with prefix
+    - range(low: str, high: str) -> Iterator[Tuple[int, str]]: terms in [low, high)
+    """
+    def __init__(self, sorted_keys: Iterable[bytes] = ()):
+        buffer = bytearray()
+        self._block_offsets = array("Q")
+        self._num_terms = 0
+        previous = b""
+        for key in sorted_keys:
+            if self._num_terms % BLOCK_SIZE == 0:
+                self._block_offsets.append(len(buffer))
+                encode_varint(len(key), buffer)
+                buffer += key
+            else:
+                shared = 0
+                max_shared = min(len(key), len(previous))
+                while shared < max_shared and key[shared] == previous[shared]:
+                    shared += 1
+                encode_varint(shared, buffer)
+                encode_varint(len(key) - shared, buffer)
+                buffer += key[shared:]
+            previous = key
+            self._num_terms += 1
+
+        self._buffer = bytes(buffer)
+
+    @classmethod
+    def from_words(cls, words: Iterable[str]):
+        return cls(sorted(word.encode() for word in words))
+
+    @property
+    def nbytes(self) -> int:
+        """Size of dictionary data in bytes"""
+        return len(self._buffer) + self._block_offsets.itemsize * len(self._block_offsets)
+
+    def __len__(self) -> int:
+        return self._num_terms
+
+    def _block_head(self, block: int) -> bytes:
+        length, position = decode_varint(self._buffer, self._block_offsets[block])
+        return self._buffer[position:position + length]
+
+    def _iter_keys(self, start_block: int) -> Iterator[Tuple[int, bytes]]:
+        """Iterate (term id, key) pairs from the beginning of block"""
+        term_id = start_block * BLOCK_SIZE
+        if term_id >= self._num_terms:
+            return
+
+        position = self._block_offsets[start_block]
+        key = b""
+        while term_id < self._num_terms:
+            if term_id % BLOCK_SIZE == 0:
+                length, position = decode_varint(self._buffer, position)
+                key = self._buffer[position:position + length]
+                position += length
+            else:
+                shared, position = decode_varint(self._buffer, position)
+                length, position = decode_varint(self._buffer, position)
+                key = key[:shared] + self._buffer[position:position + length]
+                position += length
+            yield term_id, key
+            term_id += 1
+
+    def _iter_from(self, key: bytes) -> Iterator[Tuple[int, bytes]]:
+        """Iterate (term id, key) pairs starting from the first key >= key"""
+        low, high = 0, len(self._block_offsets)
+        while low < high:
+            middle = (low + high) // 2
+            if self._block_head(middle) <= key:
+                low = middle + 1
+            else:
+                high = middle
+
+        for term_id, term_key in self._iter_keys(max(low - 1, 0)):
+            if term_key >= key:
+                yield term_id, term_key
+
+    def __iter__(self) -> Iterator[str]:
+        for _, key in self._iter_keys(0):
+            yield key.decode()
+
+    def __getitem__(self, term_id: int) -> str:
+        if not 0 <= term_id < self._num_terms:
+            raise IndexError(term_id)
+
+        for current_id, key in self._iter_keys(term_id // BLOCK_SIZE):
+            if current_id == term_id:
+                return key.decode()
+
+    def find(self, word: str) -> int:
+        """Return term id of word or -1"""
+        key = word.encode()
+        for term_id, term_key in self._iter_from(key):
+            return term_id if term_key == key else -1
+
+        return -1
+
+    def prefix(self, prefix: str) -> Iterator[Tuple[int, str]]:
+        """Iterate (term id, term) pairs of terms which start with prefix"""
+        key = prefix.encode()
+        for term_id, term_key in self._iter_from(key):
+            if not term_key.startswith(key):
+                return
+            yield term_id, term_key.decode()
+
+    def range(self, low: str, high: str) -> Iterator[Tuple[int, str]]:
+        """Iterate (term id, term) pairs of terms in range [low, high)"""
+        high_key = high.encode()
+        for term_id, term_key in self._iter_from(low.encode()):
+            if term_key >= high_key:
+                return
+            yield term_id, term_key.decode()
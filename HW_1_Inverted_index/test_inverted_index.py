@@ -1,10 +1,50 @@
+from collections import OrderedDict
+import gzip
+from io import StringIO
+import json
 import os
+import random
+import sys
+from threading import Thread
 from textwrap import dedent
+import time
 
 import pytest
 
-from inverted_index_starter import InvertedIndex, load_documents, build_inverted_index
-from storage_policy import ArrayStoragePolicy, JsonStoragePolicy
+from inverted_index_starter import (
+    InvertedIndex,
+    load_documents,
+    build_inverted_index,
+    build_inverted_index_parallel,
+    build_inverted_index_external,
+    run_query_batch,
+    SegmentedInvertedIndex,
+    ShardedInvertedIndex,
+    build_sharded_inverted_index,
+    load_inverted_index,
+    split_file_into_chunks,
+)
+from benchmark_inverted_index import generate_corpus, run_benchmark
+from boolean_query import PostingsIterator, QuerySyntaxError, parse_query
+from document_reader import iter_records
+from inverted_index_server import InvertedIndexClient, make_server, measure_latency
+from positional_index import match_phrase
+from posting_codec import decode_postings, encode_postings
+from posting_list import intersect_postings
+from ranking import Bm25Statistics
+from stage_stats import StageStats
+from storage_policy import (
+    ArrayStoragePolicy,
+    CompressedStoragePolicy,
+    IndexFormatError,
+    JsonStoragePolicy,
+    MmapStoragePolicy,
+    PackedPostingsDict,
+    detect_storage_policy,
+    verify_index_file,
+)
+from term_dictionary import FrontCodedTermDictionary
+from tokenizer import Tokenizer, Vocabulary
 
 
 DATASET_BIG_FPATH = "./test_data/wikipedia_sample.txt"
@@ -252,3 +292,695 @@ def test_inverted_index_query():
     assert inv_ind.query(["adsfaf", "q"]).sort() == [2].sort()
     assert inv_ind.query(["adsfaf", "w"]).sort() == [5].sort()
     assert inv_ind.query(["adsfaf", "q", "w"]).sort() == [2, 5].sort()
+
+
+def test_can_dump_and_load_inverted_index_with_mmap_policy(tmpdir, tiny_dataset_fio):
+    index_fio = tmpdir.join("index.dump")
+    etalon_inverted_index = build_inverted_index(load_documents(tiny_dataset_fio))
+    etalon_inverted_index.dump(index_fio, storage_policy="mmap_storage_policy")
+    loaded_inverted_index = InvertedIndex.load(index_fio, storage_policy="mmap_storage_policy")
+    assert etalon_inverted_index == loaded_inverted_index, (
+        "load should return same inverted index"
+    )
+    assert sorted(loaded_inverted_index.query(["A_word", "with"])) == ["123", "3128"]
+    assert loaded_inverted_index.query(["word_does_not_exist"]) == []
+
+
+def test_mmap_policy_decodes_posting_lists_lazily(tmpdir):
+    index_fio = tmpdir.join("index.dump")
+    MmapStoragePolicy.dump({"b": ["7"], "a": ["1", "70000"], "c": []}, index_fio)
+    mapping = MmapStoragePolicy.load(index_fio)
+
+    assert len(mapping) == 3
+    assert list(mapping) == ["a", "b", "c"]
+    assert "b" in mapping and "d" not in mapping
+    assert mapping["a"] == ["1", "70000"]
+    assert mapping.get("c") == []
+    assert mapping.get("d") is None
+
+
+@pytest.mark.parametrize(
+    "doc_ids",
+    [
+        pytest.param([], id="empty"),
+        pytest.param([5, 1, 3], id="unsorted"),
+        pytest.param([0, 127, 128, 32768, 2 ** 32 - 1, 2 ** 63 + 5], id="large ids"),
+    ]
+)
+def test_posting_codec_round_trip(doc_ids):
+    assert decode_postings(encode_postings(doc_ids)) == sorted(doc_ids)
+
+
+def test_can_dump_and_load_inverted_index_with_compressed_policy(tmpdir):
+    index_fio = tmpdir.join("index.dump")
+    etalon_inverted_index = build_inverted_index([
+        "40000   some words with A_word",
+        "2       some words",
+        "5000000000    words A_word",
+    ])
+    etalon_inverted_index.dump(index_fio, storage_policy="compressed_storage_policy")
+    loaded_inverted_index = InvertedIndex.load(index_fio, storage_policy="compressed_storage_policy")
+    assert etalon_inverted_index == loaded_inverted_index, (
+        "load should return same inverted index"
+    )
+    assert loaded_inverted_index.inv_idx_dict["words"] == ["2", "40000", "5000000000"]
+
+
+def test_array_policy_rejects_large_document_ids(tmpdir):
+    index_fio = tmpdir.join("index.dump")
+    inverted_index = build_inverted_index(["40000   some words"])
+    with pytest.raises(ValueError, match="compressed_storage_policy"):
+        inverted_index.dump(index_fio, storage_policy="array_storage_policy")
+
+
+def test_negative_document_ids_can_be_queried(tmpdir):
+    index_fio = tmpdir.join("index.dump")
+    inverted_index = build_inverted_index(["-5 a b", "3 a", "-7 b c"])
+    assert inverted_index.query(["a"]) == ["-5", "3"]
+    assert inverted_index.query(["a", "b"]) == ["-5"]
+    assert inverted_index.query_boolean("b OR c") == ["-7", "-5"]
+    assert inverted_index.query_boolean("a AND NOT b") == ["3"]
+
+    inverted_index.dump(index_fio, storage_policy="array_storage_policy")
+    loaded_index = InvertedIndex.load(index_fio)
+    assert loaded_index.query(["a"]) == ["-5", "3"]
+    assert loaded_index.query(["b"]) == ["-7", "-5"]
+
+
+@pytest.mark.parametrize(
+    "postings_lists, etalon_answer",
+    [
+        pytest.param([[1, 3, 5], [2, 3, 5, 8]], [3, 5], id="two lists"),
+        pytest.param([list(range(0, 1000, 2)), list(range(0, 1000, 3)), [6, 500, 996]], [6, 996], id="gallop"),
+        pytest.param([[1, 2], []], [], id="empty list"),
+        pytest.param([[4, 9]], [4, 9], id="one list"),
+    ]
+)
+def test_intersect_postings(postings_lists, etalon_answer):
+    assert list(intersect_postings(postings_lists)) == etalon_answer
+
+
+def test_query_returns_sorted_documents(tiny_dataset_fio):
+    tiny_inverted_index = build_inverted_index(load_documents(tiny_dataset_fio))
+    assert tiny_inverted_index.query(["words", "with"]) == ["2", "123", "3128"]
+    assert tiny_inverted_index.query(["with", "words", "with"]) == ["2", "123", "3128"]
+
+
+@pytest.mark.parametrize("workers", [1, 2, 3, 8])
+def test_split_file_into_chunks_on_line_boundaries(tiny_dataset_fio, workers):
+    chunks = split_file_into_chunks(tiny_dataset_fio, workers)
+    content = tiny_dataset_fio.read_binary()
+
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(content)
+    assert all(left[1] == right[0] for left, right in zip(chunks, chunks[1:]))
+    assert all(content[start - 1:start] == b"\n" for start, _ in chunks[1:])
+
+
+@pytest.mark.parametrize("storage_policy", ["array_storage_policy", "compressed_storage_policy"])
+def test_parallel_build_is_byte_identical(tmpdir, tiny_dataset_fio, storage_policy):
+    serial_fio = tmpdir.join("serial.dump")
+    parallel_fio = tmpdir.join("parallel.dump")
+    build_inverted_index(load_documents(tiny_dataset_fio)).dump(serial_fio, storage_policy)
+    build_inverted_index_parallel(tiny_dataset_fio, workers=3).dump(parallel_fio, storage_policy)
+
+    assert serial_fio.read_binary() == parallel_fio.read_binary()
+
+
+@pytest.mark.parametrize("memory_limit", [1, 10 ** 9])
+@pytest.mark.parametrize("storage_policy", ["compressed_storage_policy", "mmap_storage_policy"])
+def test_external_build_returns_same_inverted_index(tmpdir, tiny_dataset_fio, memory_limit, storage_policy):
+    index_fio = tmpdir.join("index.dump")
+    build_inverted_index_external(tiny_dataset_fio, index_fio, memory_limit, storage_policy)
+    etalon_inverted_index = build_inverted_index(load_documents(tiny_dataset_fio))
+    loaded_inverted_index = InvertedIndex.load(index_fio, storage_policy=storage_policy)
+    assert etalon_inverted_index == loaded_inverted_index, (
+        "external build should return same inverted index"
+    )
+
+
+def test_external_build_requires_sorted_dump(tmpdir, tiny_dataset_fio):
+    with pytest.raises(ValueError):
+        build_inverted_index_external(
+            tiny_dataset_fio, tmpdir.join("index.dump"), 1, "json_storage_policy"
+        )
+
+
+@pytest.mark.parametrize("cache_size", [0, 1, 16])
+def test_run_query_batch(tiny_dataset_fio, cache_size):
+    tiny_inverted_index = build_inverted_index(load_documents(tiny_dataset_fio))
+    queries = [["A_word"], ["B_word", "A_word"], ["A_word"], ["nothing"], ["A_word", "B_word"]]
+    output = StringIO()
+    run_query_batch(tiny_inverted_index, queries, output, cache_size=cache_size)
+
+    assert output.getvalue() == "123,3128\n3128\n123,3128\n\n3128\n"
+
+
+def test_postings_cache_keeps_last_used_words(tiny_dataset_fio):
+    tiny_inverted_index = build_inverted_index(load_documents(tiny_dataset_fio))
+    tiny_inverted_index.postings_cache_size = 2
+    for word in ["A_word", "B_word", "A_word", "nothing"]:
+        tiny_inverted_index._get_postings(word)
+
+    assert list(tiny_inverted_index._postings_cache) == ["A_word", "nothing"]
+    assert tiny_inverted_index.query(["B_word", "A_word"]) == ["3128"]
+
+
+@pytest.fixture
+def tiny_inverted_index_server(tiny_dataset_fio):
+    server = make_server(build_inverted_index(load_documents(tiny_dataset_fio)), port=0)
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_inverted_index_server_answers_queries(tiny_inverted_index_server):
+    client = InvertedIndexClient(*tiny_inverted_index_server.server_address)
+    assert client.query(["A_word"]) == ["123", "3128"]
+    assert client.query(["A_word", "B_word"]) == ["3128"]
+    assert client.query(["word_does_not_exist"]) == []
+
+    latency = measure_latency(client, [["A_word"], ["B_word"]], repeat=5)
+    assert latency["queries"] == 10
+    client.close()
+
+
+class SwitchingOrderedDict(OrderedDict):
+    """Cache which lets other threads run between a check of key and the next operation"""
+    def __contains__(self, key):
+        contains = super().__contains__(key)
+        time.sleep(0.0001)
+        return contains
+
+
+def test_inverted_index_answers_concurrent_queries():
+    documents = [f"{doc_id} " + " ".join(f"w{word}" for word in range(doc_id % 16, 16, 3)) for doc_id in range(64)]
+    inverted_index = build_inverted_index(documents)
+    inverted_index.postings_cache_size = 2
+    inverted_index._postings_cache = SwitchingOrderedDict()
+    queries = [[f"w{word}", f"w{word + 3}", f"w{(word + 6) % 16}"] for word in range(13)]
+    etalon_answers = [build_inverted_index(documents).query(words) for words in queries]
+    errors = []
+
+    def run_queries(seed):
+        # the same calls as in threads of ThreadingHTTPServer of serve command
+        rng = random.Random(seed)
+        try:
+            for _ in range(100):
+                query_num = rng.randrange(len(queries))
+                assert etalon_answers[query_num] == inverted_index.query(queries[query_num])
+        except Exception as error:
+            errors.append(error)
+
+    threads = [Thread(target=run_queries, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+
+
+def test_segmented_inverted_index_updates(tmpdir, tiny_dataset_fio):
+    index_fio = tmpdir.join("index.dump")
+    build_inverted_index(load_documents(tiny_dataset_fio)).dump(index_fio, "compressed_storage_policy")
+    segmented_index = SegmentedInvertedIndex.load(index_fio, "compressed_storage_policy")
+    segmented_index.add_documents(["7 new A_word", "123 replaced B_word"])
+    segmented_index.delete_documents(["3128"])
+
+    loaded_index = load_inverted_index(index_fio)
+    assert isinstance(loaded_index, SegmentedInvertedIndex)
+    assert loaded_index.query(["A_word"]) == ["7"]
+    assert loaded_index.query(["B_word"]) == ["2", "123"]
+    assert loaded_index.query(["words", "with"]) == ["2"]
+
+    loaded_index.compact()
+    assert not os.path.exists(loaded_index.manifest_filepath)
+    compacted_index = load_inverted_index(index_fio, "compressed_storage_policy")
+    assert isinstance(compacted_index, InvertedIndex)
+    assert compacted_index.query(["A_word"]) == ["7"]
+    assert compacted_index.query(["B_word"]) == ["2", "123"]
+    assert compacted_index.query(["document"]) == []
+
+
+def test_segmented_inverted_index_supports_all_queries(tmpdir, tiny_dataset_fio):
+    index_fio = tmpdir.join("index.dump")
+    build_inverted_index(
+        load_documents(tiny_dataset_fio), with_frequencies=True, with_positions=True,
+    ).dump(index_fio, "compressed_storage_policy")
+    segmented_index = SegmentedInvertedIndex.load(index_fio)
+    segmented_index.add_documents(["7 to be A_word", "123 replaced B_word"])
+    segmented_index.delete_documents(["3128"])
+
+    loaded_index = load_inverted_index(index_fio)
+    assert loaded_index.query_boolean("A_word OR B_word") == ["2", "7", "123"]
+    assert loaded_index.query_boolean("words AND NOT A_word", limit=1) == ["2"]
+    assert loaded_index.query_phrase(["to", "be"]) == ["5", "7"]
+    ranked = loaded_index.query_ranked(["A_word", "B_word"], top_k=10)
+    assert sorted(doc_id for doc_id, _ in ranked) == ["123", "2", "7"]
+    assert loaded_index.query_ranked(["A_word", "B_word"], top_k=2) == ranked[:2]
+
+
+def test_compact_merges_term_frequencies(tmpdir, tiny_dataset_fio):
+    index_fio = tmpdir.join("index.dump")
+    documents = load_documents(tiny_dataset_fio)
+    build_inverted_index(documents, with_frequencies=True).dump(index_fio, "compressed_storage_policy")
+    segmented_index = SegmentedInvertedIndex.load(index_fio)
+    segmented_index.add_documents(["7 alpha A_word", "123 replaced B_word"])
+    segmented_index.delete_documents(["3128"])
+    segmented_index.compact()
+
+    assert sorted(os.listdir(tmpdir)) == ["dataset.txt", "index.dump", "index.dump.bm25"]
+    compacted_index = load_inverted_index(index_fio)
+    etalon_index = build_inverted_index(
+        [documents[1], documents[2], "7 alpha A_word", "123 replaced B_word"], with_frequencies=True,
+    )
+    assert compacted_index.bm25_statistics == etalon_index.bm25_statistics
+    assert compacted_index.query_ranked(["alpha"]) == etalon_index.query_ranked(["alpha"])
+
+
+def test_compact_merges_positions(tmpdir, tiny_dataset_fio):
+    index_fio = tmpdir.join("index.dump")
+    build_inverted_index(load_documents(tiny_dataset_fio), with_positions=True).dump(index_fio)
+    segmented_index = SegmentedInvertedIndex.load(index_fio)
+    segmented_index.add_documents(["7 alpha beta", "5 not to be"])
+    segmented_index.compact()
+
+    assert sorted(os.listdir(tmpdir)) == ["dataset.txt", "index.dump", "index.dump.positions"]
+    compacted_index = load_inverted_index(index_fio)
+    assert compacted_index.query_phrase(["alpha", "beta"]) == ["7"]
+    assert compacted_index.query_phrase(["to", "be"]) == ["5"]
+    assert compacted_index.query_phrase(["or", "not"]) == []
+
+
+def _brute_force_bm25(documents, words):
+    statistics = Bm25Statistics.from_documents(documents)
+    scores = {}
+    for document in documents:
+        document_id, *data = document.split()
+        score = 0.0
+        for word in set(words):
+            if word in data:
+                document_frequency = len(statistics.term_frequencies[word])
+                score += statistics.term_score(
+                    statistics.idf(document_frequency), data.count(word), len(data)
+                )
+        if score:
+            scores[document_id] = score
+
+    return sorted(scores.items(), key=lambda item: (-item[1], int(item[0])))
+
+
+@pytest.mark.parametrize("top_k", [1, 3, 10, 1000])
+@pytest.mark.parametrize("words", [["w0"], ["w0", "w3"], ["w1", "w7", "w20"], ["missing", "w2"]])
+def test_query_ranked_matches_brute_force(top_k, words):
+    random.seed(13)
+    documents = [
+        f"{doc_id} " + " ".join(f"w{int(random.paretovariate(1.2))}" for _ in range(random.randint(1, 30)))
+        for doc_id in random.sample(range(100000), 300)
+    ]
+    inverted_index = build_inverted_index(documents, with_frequencies=True)
+    answer = inverted_index.query_ranked(words, top_k)
+    etalon_answer = _brute_force_bm25(documents, words)[:top_k]
+
+    assert [doc_id for doc_id, _ in answer] == [doc_id for doc_id, _ in etalon_answer]
+    assert [score for _, score in answer] == pytest.approx([score for _, score in etalon_answer])
+
+
+def test_query_ranked_expands_wildcard():
+    random.seed(13)
+    documents = [
+        f"{doc_id} " + " ".join(f"w{int(random.paretovariate(1.2))}" for _ in range(random.randint(1, 30)))
+        for doc_id in random.sample(range(100000), 300)
+    ]
+    inverted_index = build_inverted_index(documents, with_frequencies=True)
+    words = sorted({word for document in documents for word in document.split()[1:] if word.startswith("w1")})
+    answer = inverted_index.query_ranked(["w1*"], 10)
+    etalon_answer = _brute_force_bm25(documents, words)[:10]
+
+    assert [doc_id for doc_id, _ in answer] == [doc_id for doc_id, _ in etalon_answer]
+    assert [score for _, score in answer] == pytest.approx([score for _, score in etalon_answer])
+
+
+def test_indexed_words_with_asterisk_are_not_expanded_again(tmpdir):
+    documents = ["1 a* b", "2 ab", "3 see * list"]
+    inverted_index = build_inverted_index(documents, with_frequencies=True)
+    assert inverted_index.query(["a*"]) == ["1", "2"]
+    assert inverted_index.document_frequency("a*") == 2
+    assert inverted_index.query_boolean("see AND *") == ["3"]
+    assert [doc_id for doc_id, _ in inverted_index.query_ranked(["a*"])] == ["2", "1"]
+
+    index_fio = tmpdir.join("index.dump")
+    inverted_index.dump(index_fio)
+    segmented_index = SegmentedInvertedIndex.load(index_fio)
+    segmented_index.add_documents(["4 * again"])
+    segmented_index.compact()
+    compacted_index = load_inverted_index(index_fio)
+    etalon_index = build_inverted_index(documents + ["4 * again"], with_frequencies=True)
+    assert compacted_index.bm25_statistics == etalon_index.bm25_statistics
+    assert compacted_index.query(["see", "*"]) == ["3"]
+
+
+def test_can_dump_and_load_bm25_statistics(tmpdir, tiny_dataset_fio):
+    index_fio = tmpdir.join("index.dump")
+    etalon_inverted_index = build_inverted_index(load_documents(tiny_dataset_fio), with_frequencies=True)
+    etalon_inverted_index.dump(index_fio, storage_policy="mmap_storage_policy")
+    loaded_inverted_index = InvertedIndex.load(index_fio, storage_policy="mmap_storage_policy")
+
+    assert etalon_inverted_index.bm25_statistics == loaded_inverted_index.bm25_statistics
+    assert loaded_inverted_index.query_ranked(["be", "A_word"], 2)[0][0] == "5"
+
+
+def test_generate_corpus_is_reproducible(tmpdir):
+    first_fio = tmpdir.join("first.txt")
+    second_fio = tmpdir.join("second.txt")
+    generate_corpus(first_fio, num_documents=20, words_per_document=5, vocabulary_size=30, seed=1)
+    generate_corpus(second_fio, num_documents=20, words_per_document=5, vocabulary_size=30, seed=1)
+
+    assert first_fio.read() == second_fio.read()
+    assert len(load_documents(first_fio)) == 20
+
+
+def test_run_benchmark_reports_every_stage():
+    report = run_benchmark(num_documents=50, words_per_document=5, vocabulary_size=100, num_queries=10)
+    stages = report["stages"]
+
+    assert {"load_documents", "build_inverted_index", "mmap_storage_policy"}.issubset(stages)
+    assert stages["mmap_storage_policy"]["query"]["queries_per_second"] > 0
+    assert stages["mmap_storage_policy"]["load"]["peak_rss_kb"] >= stages["mmap_storage_policy"]["load"]["start_rss_kb"]
+    assert json.loads(json.dumps(report)) == report
+
+
+TERMS = ["a", "ab", "abc", "abd", "b", "ba", "bab", "c", "xyz", "яблоко"] + [f"t{i:03}" for i in range(50)]
+
+
+def test_front_coded_term_dictionary():
+    term_dictionary = FrontCodedTermDictionary.from_words(TERMS)
+    etalon_terms = sorted(TERMS, key=str.encode)
+
+    assert list(term_dictionary) == etalon_terms
+    assert [term_dictionary[term_id] for term_id in range(len(TERMS))] == etalon_terms
+    assert all(term_dictionary.find(term) == etalon_terms.index(term) for term in TERMS)
+    assert term_dictionary.find("aa") == -1 and term_dictionary.find("zzz") == -1
+    assert [term for _, term in term_dictionary.prefix("ab")] == ["ab", "abc", "abd"]
+    assert [term for _, term in term_dictionary.prefix("t01")] == [f"t01{i}" for i in range(10)]
+    assert [term for _, term in term_dictionary.range("abd", "bab")] == ["abd", "b", "ba"]
+    assert term_dictionary.nbytes < sum(sys.getsizeof(term) for term in TERMS)
+
+
+@pytest.mark.parametrize("storage_policy", ["json_storage_policy", "compressed_storage_policy", "mmap_storage_policy"])
+def test_query_with_prefix(tmpdir, storage_policy):
+    index_fio = tmpdir.join("index.dump")
+    build_inverted_index([
+        "1 apple banana", "2 application", "3 apply banana", "4 cherry",
+    ]).dump(index_fio, storage_policy)
+    inverted_index = InvertedIndex.load(index_fio, storage_policy)
+
+    assert inverted_index.terms_with_prefix("app") == ["apple", "application", "apply"]
+    assert inverted_index.terms_in_range("b", "cherry") == ["banana"]
+    assert inverted_index.query(["app*"]) == ["1", "2", "3"]
+    assert inverted_index.query(["app*", "banana"]) == ["1", "3"]
+    assert inverted_index.query(["zz*"]) == []
+
+
+def test_compressed_policy_loads_packed_mapping(tmpdir, tiny_dataset_fio):
+    index_fio = tmpdir.join("index.dump")
+    etalon_inverted_index = build_inverted_index(load_documents(tiny_dataset_fio))
+    etalon_inverted_index.dump(index_fio, storage_policy="compressed_storage_policy")
+    mapping = CompressedStoragePolicy.load(index_fio)
+
+    assert isinstance(mapping, PackedPostingsDict)
+    assert mapping == etalon_inverted_index.inv_idx_dict
+
+
+@pytest.mark.parametrize(
+    "positions_lists, slop, etalon_answer",
+    [
+        pytest.param([[0, 4], [1, 5]], 0, True, id="phrase"),
+        pytest.param([[1], [0]], 0, False, id="wrong order"),
+        pytest.param([[0], [3]], 1, False, id="too far"),
+        pytest.param([[0], [3]], 2, True, id="proximity"),
+        pytest.param([[0, 4], [1, 5], [2, 9]], 0, True, id="three words"),
+        pytest.param([[0, 5], [2, 6], [3]], 1, True, id="backtrack"),
+        pytest.param([list(range(200))] * 10 + [[1000]], 3, False, id="many positions"),
+    ]
+)
+def test_match_phrase(positions_lists, slop, etalon_answer):
+    assert match_phrase(positions_lists, slop) == etalon_answer
+
+
+def test_query_phrase(tmpdir, tiny_dataset_fio):
+    index_fio = tmpdir.join("index.dump")
+    build_inverted_index(load_documents(tiny_dataset_fio), with_positions=True).dump(index_fio)
+    inverted_index = InvertedIndex.load(index_fio)
+
+    assert inverted_index.query_phrase(["to", "be", "or", "not", "to", "be"]) == ["5"]
+    assert inverted_index.query_phrase(["some", "words"]) == ["2", "123"]
+    assert inverted_index.query_phrase(["words", "some"]) == []
+    assert inverted_index.query_phrase(["words", "B_word"]) == []
+    assert inverted_index.query_phrase(["words", "B_word"], slop=1) == ["2"]
+    assert inverted_index.query_phrase(["A_word", "B_word"], slop=2) == ["3128"]
+    with pytest.raises(ValueError):
+        inverted_index.query_phrase(["to", "b*"])
+
+
+def test_tokenizer_normalizes_documents_and_queries():
+    tokenizer = Tokenizer(lowercase=True, strip_punctuation=True, stemmer="light")
+
+    assert tokenizer.split_document("12\tHello, Worlds! Testing") == ("12", ["hello", "world", "test"])
+    assert tokenizer.normalize_query(["WORLDS", "don't", "Test*"]) == ["world", "don", "t", "test*"]
+    assert Tokenizer().split_document("5  to be  or") == ("5", ["to", "be", "or"])
+    assert Tokenizer().normalize_query(["A_word"]) == ["A_word"]
+
+
+def test_vocabulary_interns_words():
+    vocabulary = Vocabulary()
+    assert [vocabulary.intern(word) for word in ["b", "a", "b", "c"]] == [0, 1, 0, 2]
+    assert vocabulary.words == ["b", "a", "c"]
+    assert vocabulary.lookup("c") == 2 and vocabulary.lookup("d") == -1
+
+
+def test_build_and_query_share_tokenizer(tmpdir):
+    index_fio = tmpdir.join("index.dump")
+    tokenizer = Tokenizer(lowercase=True, strip_punctuation=True, stemmer="light")
+    build_inverted_index(
+        ["1 Python, Snakes!", "2 the python snake", "3 Pythonic code"], tokenizer=tokenizer,
+    ).dump(index_fio, "compressed_storage_policy")
+    inverted_index = InvertedIndex.load(index_fio, "compressed_storage_policy")
+
+    assert inverted_index.tokenizer == tokenizer
+    assert inverted_index.query(["PYTHON", "snakes"]) == ["1", "2"]
+    assert inverted_index.query(["python."]) == ["1", "2"]
+    assert inverted_index.query(["Pyth*"]) == ["1", "2", "3"]
+
+
+@pytest.mark.parametrize("storage_policy", [
+    "array_storage_policy", "json_storage_policy", "compressed_storage_policy", "mmap_storage_policy",
+])
+def test_load_detects_storage_policy(tiny_dataset_fio, tmpdir, storage_policy):
+    index_fio = tmpdir.join("index.dump")
+    build_inverted_index(load_documents(tiny_dataset_fio)).dump(index_fio, storage_policy)
+    inverted_index = InvertedIndex.load(index_fio)
+
+    assert detect_storage_policy(index_fio) == storage_policy
+    assert inverted_index.storage_policy == storage_policy
+    assert inverted_index.query(["words", "A_word"]) == ["123", "3128"]
+
+
+@pytest.mark.parametrize("storage_policy", [
+    "array_storage_policy", "compressed_storage_policy", "mmap_storage_policy",
+])
+def test_load_rejects_truncated_and_corrupted_index(tiny_dataset_fio, tmpdir, storage_policy):
+    index_fio = tmpdir.join("index.dump")
+    build_inverted_index(load_documents(tiny_dataset_fio)).dump(index_fio, storage_policy)
+    assert verify_index_file(index_fio).num_terms == 14
+    content = index_fio.read_binary()
+
+    index_fio.write_binary(content[:-1])
+    with pytest.raises(IndexFormatError):
+        InvertedIndex.load(index_fio)
+
+    index_fio.write_binary(content[:-1] + bytes([content[-1] ^ 1]))
+    with pytest.raises(IndexFormatError):
+        verify_index_file(index_fio)
+
+    index_fio.write_binary(content)
+    other_policy = "compressed_storage_policy" if storage_policy == "mmap_storage_policy" else "mmap_storage_policy"
+    with pytest.raises(IndexFormatError):
+        InvertedIndex.load(index_fio, other_policy)
+
+
+def test_failed_dump_keeps_previous_index(tiny_dataset_fio, tmpdir):
+    index_fio = tmpdir.join("index.dump")
+    build_inverted_index(load_documents(tiny_dataset_fio)).dump(index_fio, "mmap_storage_policy")
+    content = index_fio.read_binary()
+
+    broken_inverted_index = InvertedIndex()
+    broken_inverted_index.set_inverted_index_dict({"word": ["-1"]})
+    with pytest.raises(ValueError):
+        broken_inverted_index.dump(index_fio, "mmap_storage_policy")
+
+    assert index_fio.read_binary() == content
+    assert sorted(os.listdir(tmpdir)) == ["dataset.txt", "index.dump"]
+
+
+def test_sharded_index_returns_same_results(tiny_dataset_fio, tmpdir):
+    index_fio = tmpdir.join("index.dump")
+    documents = load_documents(tiny_dataset_fio)
+    build_sharded_inverted_index(
+        documents, index_fio, num_shards=3, storage_policy="compressed_storage_policy",
+        workers=2, with_frequencies=True, with_positions=True,
+    )
+    inverted_index = load_inverted_index(index_fio)
+    etalon_inverted_index = build_inverted_index(documents, with_frequencies=True, with_positions=True)
+
+    assert isinstance(inverted_index, ShardedInvertedIndex)
+    assert [(shard["min_doc_id"], shard["max_doc_id"]) for shard in inverted_index.shards] == [
+        (2, 2), (5, 5), (123, 3128),
+    ]
+    for query in [["words"], ["A_word", "with"], ["B_word"], ["w*"], ["absent"]]:
+        assert inverted_index.query(query) == etalon_inverted_index.query(query)
+    assert inverted_index.query_phrase(["some", "words"]) == ["2", "123"]
+    ranked = inverted_index.query_ranked(["words", "B_word"], top_k=2)
+    assert sorted(doc_id for doc_id, _ in ranked) == ["2", "3128"]
+    assert ranked[0][1] >= ranked[1][1]
+    inverted_index.close()
+
+
+@pytest.mark.parametrize("storage_policy", [
+    "array_storage_policy", "json_storage_policy", "compressed_storage_policy", "mmap_storage_policy",
+])
+def test_query_planner_orders_words_by_document_frequency(tiny_dataset_fio, tmpdir, storage_policy):
+    index_fio = tmpdir.join("index.dump")
+    build_inverted_index(load_documents(tiny_dataset_fio), with_frequencies=True).dump(index_fio, storage_policy)
+    inverted_index = InvertedIndex.load(index_fio)
+
+    assert inverted_index.document_frequency("words") == 3
+    assert inverted_index.document_frequency("w*") == 6
+    assert inverted_index.document_frequency("absent") == 0
+    assert inverted_index.plan_query(["words", "with", "B_word"]) == [("B_word", 2), ("with", 3), ("words", 3)]
+
+    plan = inverted_index.explain(["words", "absent", "with"])
+    assert plan["steps"][0] == {
+        "word": "absent", "document_frequency": 0, "estimated": 0, "actual": 0, "skipped": False,
+    }
+    assert [step["skipped"] for step in plan["steps"]] == [False, True, True]
+    assert inverted_index.query(["words", "absent", "with"]) == []
+
+    plan = inverted_index.explain(["words", "B_word"])
+    assert [step["actual"] for step in plan["steps"]] == [2, 2]
+    assert plan["estimated"] == pytest.approx(2 * 3 / 4)
+    assert plan["actual"] == len(inverted_index.query(["words", "B_word"])) == 2
+
+
+def test_numpy_storage_policy_keeps_uint32_postings(tiny_dataset_fio, tmpdir):
+    np = pytest.importorskip("numpy")
+    index_fio = tmpdir.join("index.dump")
+    etalon_inverted_index = build_inverted_index(load_documents(tiny_dataset_fio))
+    etalon_inverted_index.dump(index_fio, "numpy_storage_policy")
+    inverted_index = InvertedIndex.load(index_fio)
+
+    assert inverted_index.storage_policy == "numpy_storage_policy"
+    assert dict(inverted_index.inv_idx_dict) == etalon_inverted_index.inv_idx_dict
+    assert inverted_index.inv_idx_dict.get_int_postings("words").dtype == np.uint32
+    for query in [["words"], ["A_word", "with"], ["B_word", "some"], ["w*", "in"], ["absent"]]:
+        assert inverted_index.query(query) == etalon_inverted_index.query(query)
+
+    with pytest.raises(ValueError):
+        build_inverted_index([f"{2 ** 32} word"]).dump(index_fio, "numpy_storage_policy")
+
+
+def test_numpy_storage_policy_ranks_like_mmap(tmpdir, recwarn):
+    pytest.importorskip("numpy")
+    documents = ["0 a b", "1 a", "2 b a", "3 a a", "4 c"]
+    etalon_inverted_index = build_inverted_index(documents, with_frequencies=True)
+    index_fio = tmpdir.join("index.dump")
+    etalon_inverted_index.dump(index_fio, "numpy_storage_policy")
+    inverted_index = InvertedIndex.load(index_fio)
+
+    for words, top_k in [(["a"], 2), (["a", "b"], 3), (["a", "c"], 10)]:
+        assert inverted_index.query_ranked(words, top_k) == etalon_inverted_index.query_ranked(words, top_k)
+    assert not [warning for warning in recwarn if issubclass(warning.category, RuntimeWarning)]
+
+
+def test_intersect_numpy_postings():
+    np = pytest.importorskip("numpy")
+    smaller = np.array([1, 5, 9, 20], dtype=np.uint32)
+    larger = np.array([2, 5, 6, 9, 10], dtype=np.uint32)
+
+    assert list(intersect_postings([larger, smaller])) == [5, 9]
+    assert list(intersect_postings([smaller, np.array([], dtype=np.uint32)])) == []
+
+
+def test_load_documents_from_gzip(tiny_dataset_fio, tmpdir):
+    dataset_fio = tmpdir.join("dataset.txt.gz")
+    with gzip.open(dataset_fio, "wt", encoding="utf_8") as fout:
+        fout.write(DATASET_TINY_STR.replace("\n", "\r\n"))
+
+    assert load_documents(dataset_fio) == load_documents(tiny_dataset_fio)
+    assert list(iter_records(dataset_fio))[:2] == [("123", "some words with A_word"), ("2", "some words with B_word")]
+    with pytest.raises(ValueError):
+        build_inverted_index_parallel(dataset_fio, workers=2)
+
+
+def test_stage_stats_records_query_stages(tiny_dataset_fio):
+    inverted_index = build_inverted_index(load_documents(tiny_dataset_fio))
+    stage_stats = StageStats()
+    with stage_stats.stage("build") as counts:
+        counts["terms"] = len(inverted_index.inv_idx_dict)
+    run_query_batch(inverted_index, [["words"], ["absent"]], StringIO(), stage_stats=stage_stats)
+
+    stages = stage_stats.to_dict()["stages"]
+    assert [stage["stage"] for stage in stages] == ["build", "query", "query"]
+    assert stages[0]["terms"] == 14
+    assert [stage["results"] for stage in stages[1:]] == [3, 0]
+    assert all(stage["wall_seconds"] >= 0 and stage["peak_rss_kb"] > 0 for stage in stages)
+
+    disabled_stage_stats = StageStats(enabled=False)
+    with disabled_stage_stats.stage("build"):
+        pass
+    assert disabled_stage_stats.stages == []
+
+
+def test_parse_boolean_query():
+    assert parse_query("a b") == ("and", [("word", "a"), ("word", "b")])
+    assert parse_query("a AND (b OR c) AND NOT d") == ("and", [
+        ("word", "a"), ("or", [("word", "b"), ("word", "c")]), ("not", ("word", "d")),
+    ])
+    for query in ["", "a OR", "(a", "a )", "AND a"]:
+        with pytest.raises(QuerySyntaxError):
+            parse_query(query)
+
+
+def test_postings_iterator_advances_lazily():
+    iterator = PostingsIterator([1, 4, 9, 16, 25])
+    assert iterator.next() == 1
+    assert iterator.advance(10) == 16
+    assert iterator.advance(3) == 16
+    assert iterator.next() == 25
+    assert iterator.next() > 25
+
+
+@pytest.mark.parametrize("query, etalon_answer", [
+    ("words AND A_word", ["123", "3128"]),
+    ("words A_word", ["123", "3128"]),
+    ("A_word OR B_word", ["2", "123", "3128"]),
+    ("words AND NOT B_word", ["123"]),
+    ("(A_word OR famous_phrases) AND NOT (one OR some)", ["5"]),
+    ("w* AND NOT with", []),
+    ("absent OR be", ["5"]),
+])
+def test_query_boolean(tiny_dataset_fio, query, etalon_answer):
+    inverted_index = build_inverted_index(load_documents(tiny_dataset_fio))
+
+    assert inverted_index.query_boolean(query) == etalon_answer
+    assert inverted_index.query_boolean(query, limit=1) == etalon_answer[:1]
+
+
+def test_query_boolean_rejects_negative_only_query(tiny_dataset_fio):
+    inverted_index = build_inverted_index(load_documents(tiny_dataset_fio))
+    with pytest.raises(QuerySyntaxError):
+        inverted_index.query_boolean("NOT words")
+    with pytest.raises(QuerySyntaxError):
+        inverted_index.query_boolean("words OR NOT some")
@@ -0,0 +1,155 @@
+"""Tokenization of documents and queries
+
+The same Tokenizer is used to build inverted index and to query it,
+so words of documents and queries are normalized identically.
+Normalization is applied to the whole text at once (lowercase, punctuation
+translated to spaces), then the text is split and optionally stemmed.
+Default tokenizer only splits by whitespace.
+"""
+from functools import lru_cache
+import json
+from string import punctuation
+from typing import Dict, List, Tuple
+
+
+PUNCTUATION_TABLE = str.maketrans({char: " " for char in punctuation})
+WILDCARD = "*"
+STEM_CACHE_SIZE = 1 << 16
+LIGHT_STEMMER_SUFFIXES = ("ing", "ed", "s")
+LIGHT_STEMMER_MIN_STEM = 3
+
+
+def light_stem(word: str) -> str:
+    """Strip one common english suffix if a long enough stem stays"""
+    for suffix in LIGHT_STEMMER_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= LIGHT_STEMMER_MIN_STEM:
+            return word[:-len(suffix)]
+
+    return word
+
+
+STEMMERS = {
+    "light": light_stem,
+}
+
+
+class Tokenizer:
+    """Split documents and queries into normalized words
+
+    main methods:
+    - split_document(document: str) -> Tuple[str, List[str]]:
+        return document id and words of document
+    - normalize_query(words: List[str]) -> List[str]:
+        return normalized words of query, "prefix*" keeps the wildcard
+    """
+    def __init__(self, lowercase: bool = False, strip_punctuation: bool = False, stemmer: str = None):
+        if stemmer is not None and stemmer not in STEMMERS:
+            raise ValueError(f"unknown stemmer {stemmer}, choose one of {sorted(STEMMERS)}")
+
+        self.lowercase = lowercase
+        self.strip_punctuation = strip_punctuation
+        self.stemmer = stemmer
+        self._stem = lru_cache(maxsize=STEM_CACHE_SIZE)(STEMMERS[stemmer]) if stemmer else None
+
+    def __eq__(self, other):
+        return self.to_dict() == other.to_dict()
+
+    def __getstate__(self):
+        return self.to_dict()
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def is_default(self) -> bool:
+        return not (self.lowercase or self.strip_punctuation or self.stemmer)
+
+    def to_dict(self) -> Dict:
+        return {
+            "lowercase": self.lowercase,
+            "strip_punctuation": self.strip_punctuation,
+            "stemmer": self.stemmer,
+        }
+
+    @classmethod
+    def from_dict(cls, config: Dict):
+        return cls(**config)
+
+    def dump(self, filepath: str):
+        """Dump settings of tokenizer in format json"""
+        with open(filepath, "w") as file:
+            json.dump(self.to_dict(), file)
+
+    @classmethod
+    def load(cls, filepath: str):
+        """Load tokenizer from settings in format json"""
+        with open(filepath) as file:
+            return cls.from_dict(json.load(file))
+
+    def _normalize_text(self, text: str) -> str:
+        if self.lowercase:
+            text = text.lower()
+        if self.strip_punctuation:
+            text = text.translate(PUNCTUATION_TABLE)
+
+        return text
+
+    def tokenize(self, text: str) -> List[str]:
+        """Return normalized words of text"""
+        words = self._normalize_text(text).split()
+        if self._stem is not None:
+            words = list(map(self._stem, words))
+
+        return words
+
+    def split_document(self, document: str) -> Tuple[str, List[str]]:
+        """Return document id and normalized words of document"""
+        document_id, *text = document.split(None, 1)
+        return document_id, (self.tokenize(text[0]) if text else [])
+
+    def normalize_query(self, words: List[str]) -> List[str]:
+        """Return normalized words of query
+
+        Prefix of "prefix*" is normalized without stemming.
+        """
+        if self.is_default:
+            return words
+
+        normalized_words = []
+        for word in words:
+            if word.endswith(WILDCARD):
+                prefix_words = self._normalize_text(word[:-len(WILDCARD)]).split()
+                if prefix_words:
+                    prefix_words[-1] += WILDCARD
+                normalized_words.extend(prefix_words)
+            else:
+                normalized_words.extend(self.tokenize(word))
+
+        return normalized_words
+
+
+class Vocabulary:
+    """Interned words: every distinct word gets a dense integer id
+
+    It is used only while posting lists are built and is not stored with the
+    index: queries look words up in the term table of the storage policy.
+    """
+    def __init__(self):
+        self._word_to_id = {}
+        self.words = []
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def intern(self, word: str) -> int:
+        """Return id of word, new words get the next id"""
+        term_id = self._word_to_id.get(word)
+        if term_id is None:
+            term_id = self._word_to_id[word] = len(self.words)
+            self.words.append(word)
+
+        return term_id
+
+    def lookup(self, word: str) -> int:
+        """Return id of word or -1"""
+        return self._word_to_id.get(word, -1)
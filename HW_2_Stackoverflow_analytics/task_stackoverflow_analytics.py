@@ -2,11 +2,22 @@
 
 """
 from argparse import ArgumentParser
+from array import array
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import gzip
+from heapq import nsmallest
+import io
 import json
-from re import findall
+import mmap
+import os
+from re import compile as compile_regex, findall
+import struct
 import sys
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Tuple
+import zlib
 
 import logging
 import logging.config
@@ -14,7 +25,361 @@ import yaml
 
 from lxml import etree
 
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, only --columnar needs it
+    np = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, only .zst input needs it
+    zstandard = None
+
 DEFAULT_LOGGING_CONFIG_FILEPATH = "logging.conf.yml"
+QUESTION_MARKER = ' PostTypeId="1"'
+QUESTION_ATTRIBUTES = ("PostTypeId", "CreationDate", "Score", "Title")
+ATTRIBUTE_PATTERNS = {
+    name: compile_regex(rf'\s{name}="([^"]*)"') for name in QUESTION_ATTRIBUTES
+}
+SNAPSHOT_MAGIC = b"SOFA"
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_HEADER = struct.Struct(">4sHHIQ")
+SNAPSHOT_ARRAYS = (
+    ("years", "<i8"),
+    ("year_offsets", "<i8"),
+    ("word_ids", "<u4"),
+    ("scores", "<i8"),
+    ("word_offsets", "<i8"),
+    ("word_bytes", "u1"),
+)
+SNAPSHOT_ALIGNMENT = 8
+COLUMNAR_BUFFER_SIZE = 1 << 18
+YEAR_SHIFT = 32
+WORD_ID_MASK = (1 << YEAR_SHIFT) - 1
+READ_BUFFER_SIZE = 1 << 20
+STDIN_PATH = "-"
+GZIP_MAGIC = b"\x1f\x8b"
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def merge_scores(parts: List[Dict[str, int]]) -> Dict[str, int]:
+    """Sum scores of words over several {word: score} dicts, the biggest dict is copied once"""
+    parts = sorted(parts, key=len, reverse=True)
+    result = dict(parts[0]) if parts else {}
+    for part in parts[1:]:
+        for word, score in part.items():
+            result[word] = result.get(word, 0) + score
+
+    return result
+
+
+class YearIndex:
+    """Segment tree over years for sums of word scores in a range of years
+
+    Every node keeps the merged {word: score} of its years, so a range of years
+    is aggregated from O(log years) nodes instead of every year of the range.
+
+    main methods:
+    - aggregate(start_year: int, end_year: int) -> Dict[str, int]:
+        return {word: score} summed over years start_year-end_year, must not be changed
+    """
+    def __init__(self, data: Dict[int, Dict[str, int]]):
+        self.data = data
+        self.years = sorted(data)
+        self._size = len(self.years)
+        self._nodes = [None] * self._size + [data[year] for year in self.years]
+        for node in range(self._size - 1, 0, -1):
+            self._nodes[node] = merge_scores([self._nodes[2 * node], self._nodes[2 * node + 1]])
+
+    def aggregate(self, start_year: int, end_year: int) -> Dict[str, int]:
+        left = bisect_left(self.years, start_year) + self._size
+        right = bisect_right(self.years, end_year) + self._size
+        parts = []
+        while left < right:
+            if left & 1:
+                parts.append(self._nodes[left])
+                left += 1
+            if right & 1:
+                right -= 1
+                parts.append(self._nodes[right])
+            left >>= 1
+            right >>= 1
+
+        return parts[0] if len(parts) == 1 else merge_scores(parts)
+
+
+class SnapshotFormatError(ValueError):
+    """Snapshot file is broken or has unsupported format"""
+
+
+def _align(offset: int) -> int:
+    return -(-offset // SNAPSHOT_ALIGNMENT) * SNAPSHOT_ALIGNMENT
+
+
+class ColumnarData:
+    """Prepared data in integer-encoded numpy arrays
+
+    Words are numbered in sorted order and kept as one utf-8 byte array with
+    offsets. Scores of every year are a slice of word_ids and scores arrays
+    (compressed sparse rows), so a (year, word) pair costs 12 bytes.
+
+    main methods:
+    - from_data(data: Dict[int, Dict[str, int]]) (classmethod)
+    - top_words(start_year: int, end_year: int, num_words: int) -> Tuple[List[Tuple[str, int]], int]:
+        return top num_words (word, score) for years start_year-end_year
+        and the number of words found in these years
+    - save(filepath: str): write snapshot file
+    - load(filepath: str) (classmethod): memory map snapshot file
+
+    Snapshot file: header (magic, version, number of arrays, crc32 and length
+    of payload), lengths of arrays and the arrays of SNAPSHOT_ARRAYS in
+    little-endian order, every array starts at a multiple of 8 bytes.
+    """
+    def __init__(self, years, year_offsets, word_ids, scores, word_offsets, word_bytes):
+        self.years = years
+        self.year_offsets = year_offsets
+        self.word_ids = word_ids
+        self.scores = scores
+        self.word_offsets = word_offsets
+        self.word_bytes = word_bytes
+
+    @classmethod
+    def from_data(cls, data: Dict[int, Dict[str, int]]):
+        if np is None:
+            raise ImportError("package numpy is required for columnar data")
+
+        vocabulary = sorted({word for word_scores in data.values() for word in word_scores})
+        word_to_id = {word: word_id for word_id, word in enumerate(vocabulary)}
+        word_offsets, word_bytes = cls._encode_vocabulary(vocabulary)
+
+        years = sorted(data)
+        year_offsets = np.zeros(len(years) + 1, dtype=np.int64)
+        np.cumsum([len(data[year]) for year in years], out=year_offsets[1:])
+        word_ids = np.fromiter(
+            (word_to_id[word] for year in years for word in data[year]),
+            dtype=np.uint32, count=int(year_offsets[-1]),
+        )
+        scores = np.fromiter(
+            (score for year in years for score in data[year].values()),
+            dtype=np.int64, count=int(year_offsets[-1]),
+        )
+
+        return cls(np.array(years, dtype=np.int64), year_offsets, word_ids, scores, word_offsets, word_bytes)
+
+    @staticmethod
+    def _encode_vocabulary(vocabulary: List[str]):
+        """Return offsets and utf-8 bytes of sorted words"""
+        encoded_words = [word.encode("utf-8") for word in vocabulary]
+        word_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        np.cumsum([len(word) for word in encoded_words], out=word_offsets[1:])
+        word_bytes = np.frombuffer(b"".join(encoded_words), dtype=np.uint8)
+        return word_offsets, word_bytes
+
+    def save(self, filepath: str):
+        arrays = [
+            np.ascontiguousarray(getattr(self, name), dtype=dtype) for name, dtype in SNAPSHOT_ARRAYS
+        ]
+        payload_offset = SNAPSHOT_HEADER.size
+        lengths = struct.pack(f"<{len(arrays)}Q", *(len(array) for array in arrays))
+        payload = [lengths]
+        position = payload_offset + len(lengths)
+        for array in arrays:
+            padding = _align(position) - position
+            payload.append(b"\0" * padding + array.tobytes())
+            position += padding + array.nbytes
+
+        crc = 0
+        for part in payload:
+            crc = zlib.crc32(part, crc)
+        with open(filepath, "wb") as fout:
+            fout.write(SNAPSHOT_HEADER.pack(
+                SNAPSHOT_MAGIC, SNAPSHOT_FORMAT_VERSION, len(arrays), crc, position - payload_offset,
+            ))
+            for part in payload:
+                fout.write(part)
+
+    @classmethod
+    def load(cls, filepath: str):
+        if np is None:
+            raise ImportError("package numpy is required for snapshot")
+
+        with open(filepath, "rb") as fin:
+            buffer = mmap.mmap(fin.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(buffer) < SNAPSHOT_HEADER.size:
+            raise SnapshotFormatError(f"{filepath} is too short for snapshot")
+        magic, version, num_arrays, crc, payload_length = SNAPSHOT_HEADER.unpack_from(buffer)
+        if magic != SNAPSHOT_MAGIC:
+            raise SnapshotFormatError(f"{filepath} is not a snapshot")
+        if version != SNAPSHOT_FORMAT_VERSION or num_arrays != len(SNAPSHOT_ARRAYS):
+            raise SnapshotFormatError(f"{filepath} has unsupported snapshot version {version}")
+        if len(buffer) != SNAPSHOT_HEADER.size + payload_length:
+            raise SnapshotFormatError(f"{filepath} is truncated")
+        with memoryview(buffer) as view:
+            if zlib.crc32(view[SNAPSHOT_HEADER.size:]) != crc:
+                raise SnapshotFormatError(f"{filepath} has wrong checksum")
+
+        lengths = struct.unpack_from(f"<{num_arrays}Q", buffer, SNAPSHOT_HEADER.size)
+        position = SNAPSHOT_HEADER.size + struct.calcsize(f"<{num_arrays}Q")
+        arrays = []
+        for (_, dtype), length in zip(SNAPSHOT_ARRAYS, lengths):
+            position = _align(position)
+            arrays.append(np.frombuffer(buffer, dtype=dtype, count=length, offset=position))
+            position += arrays[-1].nbytes
+
+        return cls(*arrays)
+
+    def _word(self, word_id: int) -> str:
+        start, end = self.word_offsets[word_id], self.word_offsets[word_id + 1]
+        return self.word_bytes[start:end].tobytes().decode("utf-8")
+
+    def top_words(self, start_year: int, end_year: int, num_words: int) -> Tuple[List[Tuple[str, int]], int]:
+        first_year = np.searchsorted(self.years, start_year, side="left")
+        last_year = np.searchsorted(self.years, end_year, side="right")
+        totals = np.zeros(len(self.word_offsets) - 1, dtype=np.int64)
+        found = np.zeros(len(totals), dtype=bool)
+        for year_num in range(first_year, last_year):
+            start, end = self.year_offsets[year_num], self.year_offsets[year_num + 1]
+            word_ids = self.word_ids[start:end]
+            totals[word_ids] += self.scores[start:end]
+            found[word_ids] = True
+
+        word_ids = np.flatnonzero(found)
+        scores = totals[word_ids]
+        num_found = len(word_ids)
+        if num_words <= 0:
+            return [], num_found
+        if num_words < num_found:
+            # words tied with the num_words-th score are kept to be ordered by word
+            threshold = scores[np.argpartition(-scores, num_words - 1)[num_words - 1]]
+            selected = scores >= threshold
+            word_ids, scores = word_ids[selected], scores[selected]
+
+        order = np.lexsort((word_ids, -scores))[:num_words]
+        top = [
+            (self._word(word_id), score)
+            for word_id, score in zip(word_ids[order].tolist(), scores[order].tolist())
+        ]
+
+        return top, num_found
+
+
+class ColumnarDataBuilder:
+    """Accumulate scores of (year, word) pairs into ColumnarData while posts are parsed
+
+    Words are numbered in order of appearance, pairs are buffered as
+    (year << 32 | word id) keys and scores. A full buffer is sorted and summed
+    into a run of distinct keys, runs of similar size are merged, so memory is
+    about 16 bytes per distinct (year, word) pair plus the vocabulary.
+
+    main methods:
+    - add(year: int, words: Iterable[str], score: int)
+    - update_from_columnar_data(data: ColumnarData): add pairs of data built from other posts
+    - build() -> ColumnarData
+    """
+    def __init__(self, buffer_size: int = COLUMNAR_BUFFER_SIZE):
+        if np is None:
+            raise ImportError("package numpy is required for columnar data")
+
+        self.buffer_size = buffer_size
+        self.word_to_id = {}
+        self._keys = array("q")
+        self._scores = array("q")
+        self._runs = []
+
+    def _intern(self, word: str) -> int:
+        word_id = self.word_to_id.get(word)
+        if word_id is None:
+            word_id = self.word_to_id[word] = len(self.word_to_id)
+        return word_id
+
+    def add(self, year: int, words: Iterable[str], score: int):
+        key_base = year << YEAR_SHIFT
+        for word in words:
+            self._keys.append(key_base | self._intern(word))
+            self._scores.append(score)
+        if len(self._keys) >= self.buffer_size:
+            self._flush()
+
+    @staticmethod
+    def _sum_by_key(keys, scores):
+        """Return sorted distinct keys and sums of their scores"""
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        scores = scores[order]
+        del order
+        if not len(keys):
+            return keys, scores
+        starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1])))
+        if len(starts) == len(keys):
+            return keys, scores
+        return keys[starts], np.add.reduceat(scores, starts)
+
+    @staticmethod
+    def _merge_two_runs(left_run, right_run):
+        """Merge runs of sorted distinct keys, scores of left run are updated in place"""
+        left_keys, left_scores = left_run
+        right_keys, right_scores = right_run
+        positions = np.searchsorted(left_keys, right_keys)
+        found = positions < len(left_keys)
+        found[found] = left_keys[positions[found]] == right_keys[found]
+        left_scores[positions[found]] += right_scores[found]
+        new = ~found
+        positions = positions[new]
+        return np.insert(left_keys, positions, right_keys[new]), np.insert(left_scores, positions, right_scores[new])
+
+    def _add_run(self, keys, scores):
+        self._runs.append(self._sum_by_key(keys, scores))
+        while len(self._runs) >= 2 and len(self._runs[-2][0]) <= 2 * len(self._runs[-1][0]):
+            right_run = self._runs.pop()
+            self._runs.append(self._merge_two_runs(self._runs.pop(), right_run))
+            del right_run
+
+    def _flush(self):
+        if self._keys:
+            keys = np.frombuffer(self._keys, dtype=np.int64)
+            scores = np.frombuffer(self._scores, dtype=np.int64)
+            self._keys = array("q")
+            self._scores = array("q")
+            self._add_run(keys, scores)
+
+    def update_from_columnar_data(self, data: ColumnarData):
+        word_ids = np.array([self._intern(data._word(word_id)) for word_id in range(len(data.word_offsets) - 1)],
+                            dtype=np.int64)
+        years = np.repeat(data.years, np.diff(data.year_offsets))
+        self._add_run((years << YEAR_SHIFT) | word_ids[data.word_ids], data.scores.astype(np.int64))
+
+    def build(self) -> ColumnarData:
+        """Return accumulated data, builder is empty afterwards"""
+        self._flush()
+        vocabulary = list(self.word_to_id)
+        self.word_to_id = {}
+
+        # ids of words in order of appearance are replaced by ids in sorted order
+        sorted_word_ids = sorted(range(len(vocabulary)), key=vocabulary.__getitem__)
+        new_word_ids = np.zeros(len(vocabulary), dtype=np.int64)
+        new_word_ids[sorted_word_ids] = np.arange(len(vocabulary))
+        word_offsets, word_bytes = ColumnarData._encode_vocabulary([vocabulary[i] for i in sorted_word_ids])
+        del vocabulary, sorted_word_ids
+
+        keys, scores = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        while self._runs:
+            run_keys, run_scores = self._runs.pop()
+            run_word_ids = run_keys & WORD_ID_MASK
+            run_keys &= ~WORD_ID_MASK
+            run_keys |= new_word_ids[run_word_ids]
+            del run_word_ids
+            run = self._sum_by_key(run_keys, run_scores)
+            del run_keys, run_scores
+            keys, scores = self._merge_two_runs(run, (keys, scores))
+            del run
+
+        word_ids = (keys & WORD_ID_MASK).astype(np.uint32)
+        keys >>= YEAR_SHIFT
+        year_starts = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) else keys
+        years = keys[year_starts]
+        year_offsets = np.append(year_starts, len(keys)).astype(np.int64)
+
+        return ColumnarData(years, year_offsets, word_ids, scores, word_offsets, word_bytes)
 
 
 class StackoverflowAnalytics:
@@ -36,9 +401,19 @@ class StackoverflowAnalytics:
             2008: {'how': 74, 'i': 74, 'write': 74, 'c': 74, 'do': 74,
             'short': 74, 'in': 74, 'literal': 74}
         }
+
+    - use_columnar_data():
+        convert prepared data into compact numpy arrays of ColumnarData,
+        StackoverflowAnalytics(columnar=True) builds them while posts are parsed
+
+    - save_snapshot(filepath: str), load_snapshot(filepath: str) (classmethod):
+        save prepared data to snapshot file and load it without parsing posts
     """
-    def __init__(self):
+    def __init__(self, columnar: bool = False):
         self._data = defaultdict(dict)
+        self._year_index = None
+        self._columnar_data = None
+        self._columnar_builder = ColumnarDataBuilder() if columnar else None
         logger = logging.getLogger("stackoverflow_analytics")
         self.logger = logger
 
@@ -65,6 +440,27 @@ class StackoverflowAnalytics:
 
         return clear_title
 
+    @staticmethod
+    def _parse_question(post: str):
+        """Return attributes of question row or None for other rows
+
+        Rows without ' PostTypeId="1"' are skipped before parsing. For questions
+        only the needed attributes are cut out of the row and parsed by lxml,
+        so the big Body of the post is never parsed.
+        """
+        if QUESTION_MARKER not in post:
+            return None
+
+        raw_attributes = []
+        for name, pattern in ATTRIBUTE_PATTERNS.items():
+            match = pattern.search(post)
+            if match is None:
+                return etree.fromstring(post).attrib
+            raw_attributes.append(f'{name}="{match.group(1)}"')
+
+        attributes = etree.fromstring(f"<row {' '.join(raw_attributes)}/>").attrib
+        return attributes if attributes["PostTypeId"] == "1" else None
+
     @staticmethod
     def _preprocess_score_in_post(score: str) -> int:
         """Process score
@@ -73,9 +469,12 @@ class StackoverflowAnalytics:
         """
         return int(score)
 
-    def build_data_to_analysis(self, posts: List[str], stop_words: List[str]):
+    def build_data_to_analysis(self, posts: Iterable[str], stop_words: Iterable[str]):
         """Prepare data for further analysis
 
+        Posts are processed one by one, so they can be a generator of lines of the dump.
+        If analytics is columnar, scores are accumulated into ColumnarData without dicts.
+
         prepared data has the following structure:
         {year(int): {word(str): score(int)}}
         example:
@@ -85,12 +484,18 @@ class StackoverflowAnalytics:
             'short': 74, 'in': 74, 'literal': 74}
         }
         """
+        stop_words = set(stop_words)
+        if self._columnar_builder is not None and self._columnar_data is not None:
+            self._columnar_builder.update_from_columnar_data(self._columnar_data)
         for post in posts:
-            xml_post = etree.fromstring(post)
-            if xml_post.attrib["PostTypeId"] == '1':
-                year = self._preprocess_date_in_post(xml_post.attrib["CreationDate"])
-                score = self._preprocess_score_in_post(xml_post.attrib["Score"])
-                words = self._preprocess_title_in_post(xml_post.attrib["Title"], stop_words)
+            attributes = self._parse_question(post)
+            if attributes is not None and attributes["PostTypeId"] == "1":
+                year = self._preprocess_date_in_post(attributes["CreationDate"])
+                score = self._preprocess_score_in_post(attributes["Score"])
+                words = self._preprocess_title_in_post(attributes["Title"], stop_words)
+                if self._columnar_builder is not None:
+                    self._columnar_builder.add(year, words, score)
+                    continue
                 for word in words:
                     if year in self._data:
                         if word in self._data[year]:
@@ -101,6 +506,45 @@ class StackoverflowAnalytics:
                     else:
                         self._data[year] = {word: score}
 
+        self._year_index = None
+        if self._columnar_builder is not None:
+            self._columnar_data = self._columnar_builder.build()
+
+    def _get_year_index(self) -> YearIndex:
+        """Year index of _data, it is rebuilt after build_data_to_analysis or assignment of _data"""
+        if self._year_index is None or self._year_index.data is not self._data:
+            self._year_index = YearIndex(self._data)
+
+        return self._year_index
+
+    def use_columnar_data(self):
+        """Convert prepared data into ColumnarData and free the dicts, requires numpy"""
+        self._columnar_data = ColumnarData.from_data(self._data)
+        self._data = defaultdict(dict)
+        self._year_index = None
+
+    def save_snapshot(self, filepath: str):
+        """Save prepared data to snapshot file, requires numpy"""
+        columnar_data = self._columnar_data
+        if columnar_data is None:
+            columnar_data = ColumnarData.from_data(self._data)
+        columnar_data.save(filepath)
+
+    @classmethod
+    def load_snapshot(cls, filepath: str):
+        """Load prepared data from snapshot file, the arrays are memory mapped"""
+        sof_analytics = cls()
+        sof_analytics._columnar_data = ColumnarData.load(filepath)
+        return sof_analytics
+
+    def _top_words(self, start_year: int, end_year: int, num_words: int) -> Tuple[List[Tuple[str, int]], int]:
+        if self._columnar_data is not None:
+            return self._columnar_data.top_words(start_year, end_year, num_words)
+
+        query_data = self._get_year_index().aggregate(start_year, end_year)
+        top = nsmallest(num_words, query_data.items(), key=lambda x: (-x[1], x[0]))
+        return top, len(query_data)
+
     @staticmethod
     def _format_top_to_result(data):
         return list(map(list, data))
@@ -111,24 +555,12 @@ class StackoverflowAnalytics:
         format return: json-line
         """
         self.logger.debug("got query %s,%s,%s", start_year, end_year, num_words)
-        query_data = self._data[start_year].copy()
-        for year in range(start_year + 1, end_year + 1):
-            if year in self._data:
-                data_from_year = self._data[year].items()
-                for word, score in data_from_year:
-                    if word in query_data:
-                        query_data[word] += score
-                    else:
-                        query_data[word] = score
-
-        query_data = sorted(
-            sorted(query_data.items(), key=lambda x: x[0]),
-            key=lambda x: x[1], reverse=True
-        )
-        if len(query_data) < num_words:
+        # start_year > end_year is answered by start_year alone, as it always was
+        top, num_found = self._top_words(start_year, max(start_year, end_year), num_words)
+        if num_found < num_words:
             self.logger.warning(
                 'not enough data to answer, found %s words out of %s for period "%s,%s"',
-                len(query_data),
+                num_found,
                 num_words,
                 start_year,
                 end_year
@@ -136,31 +568,155 @@ class StackoverflowAnalytics:
         result = {
             "start": start_year,
             "end": end_year,
-            "top": self._format_top_to_result(query_data[:num_words])
+            "top": self._format_top_to_result(top)
         }
         result = json.dumps(result)
 
         return result
 
 
+@contextmanager
+def open_data(filepath: str):
+    """Open file or stdin ("-") for binary reading, gzip and zstandard input is decompressed"""
+    file = sys.stdin.buffer if filepath == STDIN_PATH else open(filepath, "rb", buffering=READ_BUFFER_SIZE)
+    try:
+        magic = file.peek(len(ZSTD_MAGIC))[:len(ZSTD_MAGIC)]
+        if magic.startswith(GZIP_MAGIC):
+            yield gzip.GzipFile(fileobj=file)
+        elif magic.startswith(ZSTD_MAGIC):
+            if zstandard is None:
+                raise ImportError(f"package zstandard is required to read {filepath}")
+            yield zstandard.ZstdDecompressor().stream_reader(file)
+        else:
+            yield file
+    finally:
+        if file is not sys.stdin.buffer:
+            file.close()
+
+
+def iter_data(filepath: str, encoding: str = "utf-8") -> Iterator[str]:
+    """Lazily read lines of data in a given format from hard drive or stdin"""
+    with open_data(filepath) as file:
+        text_file = io.TextIOWrapper(file, encoding=encoding)
+        try:
+            for line in text_file:
+                yield line.rstrip()
+        finally:
+            text_file.detach()
+
+
 def load_data(filepath: str, encoding: str = "utf-8") -> List[str]:
     """Load some data in a given format from hard drive"""
-    data = []
-    with open(filepath, encoding=encoding) as file:
-        line = file.readline()
-        while line:
-            data.append(line.rstrip())
+    return list(iter_data(filepath, encoding=encoding))
+
+
+def is_seekable_data(filepath: str) -> bool:
+    """Check that data is an uncompressed file, so it can be split by byte offsets"""
+    if filepath == STDIN_PATH:
+        return False
+
+    with open_data(filepath) as file:
+        return isinstance(file, io.BufferedReader)
+
+
+def split_file_into_chunks(filepath: str, num_chunks: int) -> List[Tuple[int, int]]:
+    """Split file into byte ranges [start, end) which begin at the start of a line"""
+    file_size = os.path.getsize(filepath)
+    boundaries = [0]
+    with open(filepath, "rb") as file:
+        for chunk_num in range(1, num_chunks):
+            file.seek(max(file_size * chunk_num // num_chunks, boundaries[-1]))
+            if file.tell() > 0:
+                file.seek(file.tell() - 1)
+                file.readline()
+            boundaries.append(file.tell())
+
+    boundaries.append(file_size)
+    return [
+        (start, end) for start, end in zip(boundaries, boundaries[1:]) if start < end
+    ]
+
+
+def iter_posts_in_chunk(filepath: str, start: int, end: int) -> Iterator[str]:
+    """Lazily read posts from byte range [start, end) of file"""
+    with open(filepath, "rb", buffering=READ_BUFFER_SIZE) as file:
+        file.seek(start)
+        position = start
+        while position < end:
             line = file.readline()
+            position += len(line)
+            yield line.decode("utf-8").rstrip()
+
+
+def _build_data_from_chunk(chunk):
+    """Prepare data for analysis from posts in byte range of file
+
+    return: {year: {word: score}} or ColumnarData if columnar is set
+    """
+    filepath, start, end, stop_words, columnar = chunk
+    sof_analytics = StackoverflowAnalytics(columnar=columnar)
+    sof_analytics.build_data_to_analysis(iter_posts_in_chunk(filepath, start, end), stop_words)
+    if columnar:
+        return sof_analytics._columnar_data
+    return dict(sof_analytics._data)
+
+
+def merge_data(parts: Iterable[Dict[int, Dict[str, int]]]) -> Dict[int, Dict[str, int]]:
+    """Merge data prepared from consecutive parts of dataset, scores of words are summed"""
+    data = defaultdict(dict)
+    for part in parts:
+        for year, word_scores in part.items():
+            year_scores = data[year]
+            for word, score in word_scores.items():
+                year_scores[word] = year_scores.get(word, 0) + score
 
     return data
 
 
+def build_data_to_analysis_parallel(
+        filepath: str, stop_words: Iterable[str], workers: int, columnar: bool = False,
+) -> StackoverflowAnalytics:
+    """Prepare data for analysis from posts file on a pool of processes
+
+    File is split into byte ranges on row boundaries, every process prepares
+    data for its range and the results are merged. The result is the same as
+    build_data_to_analysis(iter_posts(filepath), stop_words).
+    If columnar is set, parts are ColumnarData merged as they arrive.
+    """
+    if not is_seekable_data(filepath):
+        raise ValueError("parallel parsing needs an uncompressed questions file, not stdin")
+
+    stop_words = set(stop_words)
+    chunks = [
+        (filepath, start, end, stop_words, columnar)
+        for start, end in split_file_into_chunks(filepath, workers)
+    ]
+    sof_analytics = StackoverflowAnalytics(columnar=columnar)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        parts = executor.map(_build_data_from_chunk, chunks)
+        if columnar:
+            for part in parts:
+                sof_analytics._columnar_builder.update_from_columnar_data(part)
+        else:
+            sof_analytics._data = merge_data(parts)
+
+    if columnar:
+        sof_analytics._columnar_data = sof_analytics._columnar_builder.build()
+
+    return sof_analytics
+
+
 def load_posts(filepath: str) -> List[str]:
     """Load posts from hard drive"""
     posts = load_data(filepath, encoding="utf-8")
     return posts
 
 
+def iter_posts(filepath: str) -> Iterator[str]:
+    """Lazily read posts from hard drive or stdin"""
+    return iter_data(filepath, encoding="utf-8")
+
+
 def load_stop_words(filepath: str) -> List[str]:
     """Load stop words from hard drive"""
     stop_words = load_data(filepath, encoding="koi8-r")
@@ -177,11 +733,29 @@ def load_queries(filepath: str) -> List[List[int]]:
 def callback_parser(arguments):
     """Base callback for program"""
     logger = logging.getLogger("stackoverflow_analytics")
-    stop_words = load_stop_words(arguments.path_to_stop_words_dataset)
-    posts = load_posts(arguments.path_to_questions_dataset)
-    sof_analytics = StackoverflowAnalytics()
-    sof_analytics.build_data_to_analysis(posts, stop_words)
-    logger.info("process XML dataset, ready to serve queries")
+    if arguments.path_to_snapshot is not None:
+        sof_analytics = StackoverflowAnalytics.load_snapshot(arguments.path_to_snapshot)
+        logger.info("load snapshot, ready to serve queries")
+    else:
+        stop_words = load_stop_words(arguments.path_to_stop_words_dataset)
+        if arguments.workers > 1:
+            sof_analytics = build_data_to_analysis_parallel(
+                arguments.path_to_questions_dataset, stop_words, arguments.workers,
+                columnar=arguments.columnar,
+            )
+        else:
+            posts = iter_posts(arguments.path_to_questions_dataset)
+            sof_analytics = StackoverflowAnalytics(columnar=arguments.columnar)
+            sof_analytics.build_data_to_analysis(posts, stop_words)
+        logger.info("process XML dataset, ready to serve queries")
+
+    if arguments.path_to_snapshot_to_save is not None:
+        sof_analytics.save_snapshot(arguments.path_to_snapshot_to_save)
+        logger.info("save snapshot")
+
+    if arguments.path_to_query_file is None:
+        return
+
     queries = load_queries(arguments.path_to_query_file)
     for query in queries:
         response = sof_analytics.query(*query)
@@ -191,17 +765,34 @@ def callback_parser(arguments):
 
 
 def setup_parser(parser):
+    data_group = parser.add_mutually_exclusive_group(required=True)
+    data_group.add_argument(
+        "--questions", dest="path_to_questions_dataset",
+        help="path to dataset with questions to load, gzip and zstandard are decompressed, - for stdin",
+    )
+    data_group.add_argument(
+        "--snapshot", dest="path_to_snapshot",
+        help="path to snapshot saved by --save-snapshot to load instead of questions, requires numpy",
+    )
+    parser.add_argument(
+        "--stop-words", dest="path_to_stop_words_dataset",
+        help="path to dataset with stop words to load, required with --questions",
+    )
+    parser.add_argument(
+        "--queries", dest="path_to_query_file",
+        help="path to query in csv, without it queries are not processed"
+    )
     parser.add_argument(
-        "--questions", required=True, dest="path_to_questions_dataset",
-        help="path to dataset with questions to load",
+        "--save-snapshot", dest="path_to_snapshot_to_save",
+        help="path to save prepared data as snapshot, requires numpy",
     )
     parser.add_argument(
-        "--stop-words", required=True, dest="path_to_stop_words_dataset",
-        help="path to dataset with stop words to load",
+        "--workers", default=1, type=int,
+        help="number of processes to parse uncompressed questions file",
     )
     parser.add_argument(
-        "--queries", required=True, dest="path_to_query_file",
-        help="path to query in csv"
+        "--columnar", action="store_true",
+        help="accumulate prepared data into compact numpy arrays while parsing, requires numpy",
     )
     parser.set_defaults(callback=callback_parser)
 
@@ -219,6 +810,8 @@ def main():
     setup_parser(parser)
     setup_logging()
     arguments = parser.parse_args()
+    if arguments.path_to_questions_dataset is not None and arguments.path_to_stop_words_dataset is None:
+        parser.error("--stop-words is required with --questions")
     arguments.callback(arguments)
 
 
@@ -1,11 +1,18 @@
+import gzip
 import os
+import random
 from textwrap import dedent
 import json
 
 import pytest
 
 from task_stackoverflow_analytics import (
+    ColumnarData,
+    ColumnarDataBuilder,
+    SnapshotFormatError,
     StackoverflowAnalytics,
+    build_data_to_analysis_parallel,
+    iter_data,
     load_data,
     load_stop_words,
     load_posts,
@@ -219,3 +226,155 @@ def test_custom_params_from_description_homework(start, end, num_words, expected
     response = json.loads(test_analysis.query(start, end, num_words))
 
     assert response == expected
+
+
+def test_can_load_gzip_data(tmpdir):
+    data_fio = tmpdir.join("data.txt.gz")
+    with open(DATA_TINY_FPATH, "rb") as fin, gzip.open(data_fio, "wb") as fout:
+        fout.write(fin.read())
+
+    assert load_data(data_fio) == load_data(DATA_TINY_FPATH)
+    assert next(iter_data(data_fio)) == "hello world"
+
+
+def test_parse_question_skips_answers_and_unescapes_attributes():
+    answer = '<row Id="1" PostTypeId="2" CreationDate="2008-10-14T16:35:44.180" Score="3" Body="&lt;p&gt;" />'
+    question = (
+        '<row Id="2" PostTypeId="1" CreationDate="2010-11-12T07:07:41.060" Score="-1" '
+        'Body="&lt;p&gt;Title=&quot;fake&quot;&lt;/p&gt;" Title="C++ &amp; &quot;css&quot;" />'
+    )
+
+    assert StackoverflowAnalytics._parse_question(answer) is None
+    attributes = StackoverflowAnalytics._parse_question(question)
+    assert "1" == attributes["PostTypeId"]
+    assert "-1" == attributes["Score"]
+    assert 'C++ & "css"' == attributes["Title"]
+
+
+def test_query_by_year_index_matches_full_aggregation():
+    rng = random.Random(0)
+    data = {
+        year: {f"w{rng.randrange(30)}": rng.randrange(-5, 20) for _ in range(rng.randrange(1, 20))}
+        for year in rng.sample(range(2000, 2020), 13)
+    }
+    test_analysis = StackoverflowAnalytics()
+    test_analysis._data = data
+    for _ in range(200):
+        start = rng.randrange(1998, 2022)
+        end = rng.randrange(start, 2022)
+        num_words = rng.randrange(0, 40)
+        scores = {}
+        for year in range(start, end + 1):
+            for word, score in data.get(year, {}).items():
+                scores[word] = scores.get(word, 0) + score
+        etalon_top = sorted(scores.items(), key=lambda x: (-x[1], x[0]))[:num_words]
+
+        response = json.loads(test_analysis.query(start, end, num_words))
+
+        assert list(map(list, etalon_top)) == response["top"]
+
+
+def test_parallel_build_data_to_analysis_matches_serial(tmpdir, tiny_posts, tiny_stop_words):
+    dataset_fio = tmpdir.join("posts.xml")
+    dataset_fio.write("\n".join(tiny_posts * 5) + "\n")
+    serial_analysis = StackoverflowAnalytics()
+    serial_analysis.build_data_to_analysis(tiny_posts * 5, tiny_stop_words)
+
+    parallel_analysis = build_data_to_analysis_parallel(dataset_fio, tiny_stop_words, workers=3)
+
+    assert serial_analysis._data == parallel_analysis._data
+    assert serial_analysis.query(2008, 2010, 5) == parallel_analysis.query(2008, 2010, 5)
+
+
+def test_columnar_data_query_matches_dict_query():
+    pytest.importorskip("numpy")
+    rng = random.Random(1)
+    data = {
+        year: {f"слово{rng.randrange(40)}": rng.randrange(-3, 6) for _ in range(rng.randrange(1, 30))}
+        for year in rng.sample(range(2000, 2020), 10)
+    }
+    dict_analysis = StackoverflowAnalytics()
+    dict_analysis._data = data
+    columnar_analysis = StackoverflowAnalytics()
+    columnar_analysis._data = data
+    columnar_analysis.use_columnar_data()
+    for _ in range(200):
+        start = rng.randrange(1998, 2022)
+        end = rng.randrange(1998, 2022)
+        num_words = rng.randrange(0, 45)
+
+        assert dict_analysis.query(start, end, num_words) == columnar_analysis.query(start, end, num_words)
+
+
+def test_columnar_data_builder_matches_columnar_data_from_dict():
+    pytest.importorskip("numpy")
+    rng = random.Random(2)
+    builder = ColumnarDataBuilder(buffer_size=7)
+    other_builder = ColumnarDataBuilder(buffer_size=5)
+    data = {}
+    for _ in range(300):
+        year = rng.randrange(2000, 2010)
+        words = [f"w{rng.randrange(50)}" for _ in range(rng.randrange(0, 4))]
+        score = rng.randrange(-3, 4)
+        rng.choice([builder, other_builder]).add(year, words, score)
+        for word in words:
+            data.setdefault(year, {}).setdefault(word, 0)
+            data[year][word] += score
+    builder.update_from_columnar_data(other_builder.build())
+
+    built_data = builder.build()
+    etalon_data = ColumnarData.from_data(data)
+
+    for name in ("years", "year_offsets", "word_offsets", "word_bytes"):
+        assert getattr(etalon_data, name).tolist() == getattr(built_data, name).tolist()
+    for start, end in zip(etalon_data.year_offsets[:-1], etalon_data.year_offsets[1:]):
+        etalon_pairs = zip(etalon_data.word_ids[start:end].tolist(), etalon_data.scores[start:end].tolist())
+        built_pairs = zip(built_data.word_ids[start:end].tolist(), built_data.scores[start:end].tolist())
+        assert sorted(etalon_pairs) == sorted(built_pairs)
+
+
+def test_columnar_build_data_to_analysis_matches_dict_build(tmpdir, tiny_posts, tiny_stop_words):
+    pytest.importorskip("numpy")
+    dataset_fio = tmpdir.join("posts.xml")
+    dataset_fio.write("\n".join(tiny_posts * 5) + "\n")
+    dict_analysis = StackoverflowAnalytics()
+    dict_analysis.build_data_to_analysis(tiny_posts * 5, tiny_stop_words)
+    columnar_analysis = StackoverflowAnalytics(columnar=True)
+    columnar_analysis.build_data_to_analysis(tiny_posts * 2, tiny_stop_words)
+    columnar_analysis.build_data_to_analysis(tiny_posts * 3, tiny_stop_words)
+    parallel_analysis = build_data_to_analysis_parallel(dataset_fio, tiny_stop_words, workers=3, columnar=True)
+
+    assert not columnar_analysis._data
+    for start, end, num_words in [(2008, 2010, 5), (2008, 2008, 40), (2010, 2019, 3)]:
+        etalon_response = dict_analysis.query(start, end, num_words)
+        assert etalon_response == columnar_analysis.query(start, end, num_words)
+        assert etalon_response == parallel_analysis.query(start, end, num_words)
+
+
+def test_snapshot_can_be_saved_and_loaded(tmpdir, custom_data_to_analysis):
+    pytest.importorskip("numpy")
+    snapshot_filepath = str(tmpdir.join("analytics.snap"))
+    test_analysis = StackoverflowAnalytics()
+    test_analysis._data = custom_data_to_analysis
+    test_analysis.save_snapshot(snapshot_filepath)
+
+    loaded_analysis = StackoverflowAnalytics.load_snapshot(snapshot_filepath)
+
+    for start, end, num_words in [(2019, 2019, 2), (2019, 2020, 4), (2019, 2020, 40), (2021, 2030, 3)]:
+        assert test_analysis.query(start, end, num_words) == loaded_analysis.query(start, end, num_words)
+
+
+def test_snapshot_with_wrong_checksum_is_not_loaded(tmpdir, custom_data_to_analysis):
+    pytest.importorskip("numpy")
+    snapshot_filepath = str(tmpdir.join("analytics.snap"))
+    test_analysis = StackoverflowAnalytics()
+    test_analysis._data = custom_data_to_analysis
+    test_analysis.save_snapshot(snapshot_filepath)
+    with open(snapshot_filepath, "r+b") as snapshot_file:
+        snapshot_file.seek(-1, os.SEEK_END)
+        last_byte = snapshot_file.read(1)
+        snapshot_file.seek(-1, os.SEEK_END)
+        snapshot_file.write(bytes([last_byte[0] ^ 1]))
+
+    with pytest.raises(SnapshotFormatError):
+        StackoverflowAnalytics.load_snapshot(snapshot_filepath)